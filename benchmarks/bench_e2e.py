@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+End-to-end timings of btstrm against local stand-ins for Jackett, TMDB,
+btfs, fzf and the player, so performance changes can be measured offline.
+
+Usage: python benchmarks/bench_e2e.py [--runs 3] [--only SCENARIO ...]
+                                      [--json results.json]
+                                      [--compare baseline.json]
+
+fake_services.py plays Jackett and TMDB, fake_tools.py btfs, fusermount,
+fzf and the player (see their docstrings for the knobs). btstrm runs with
+a temporary HOME whose btstrm.conf points at them, so nothing outside of
+it is touched. Every scenario runs in a process of its own; cold runs
+start with an empty ~/.cache/btstrm, warm runs reuse what the previous
+run left there. The fake btfs bind-mounts its files, so scenarios that
+mount run under `unshare -rm` when not started as root.
+
+Scenarios:
+
+search         search_all() on every indexer of the Jackett stand-in
+titles         tmdb.search_alternative_titles() and posters.fetch_poster()
+               for every poster on the page
+log            btfs_log.parse_file() and LogFollower.poll() on a synthetic
+               log.txt of --log-mb MB
+mount          mount.start_btfs() and wait_until_ready() on a magnet link,
+               then the first --first-frame-kb of its video
+cli-search     `btstrm QUERY`: time to the picker and to the first frame
+cli-stream     `btstrm --stream QUERY`: also the time to the first result
+cli-title      `btstrm -t TITLE`: also the time until the preview of the
+               first poster is shown
+cli-magnet     `btstrm MAGNET`: time until btfs is mounted and to the
+               first frame
+
+Times are in seconds from the start of the process, peak RSS is the
+largest resident set of the process or any program it ran. With --compare
+the medians are shown next to those of a previous --json file.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, ROOT)
+
+from fake_services import FakeServices  # noqa: E402
+
+QUERY = "Big Buck Bunny"
+TOOLS = ("btfs", "fusermount", "fzf", "player", "chafa")
+SCENARIOS = (
+    "search",
+    "titles",
+    "log",
+    "mount",
+    "cli-search",
+    "cli-stream",
+    "cli-title",
+    "cli-magnet",
+)
+MOUNTING = ("mount", "cli-search", "cli-stream", "cli-title", "cli-magnet")
+# Arguments and the events of fake_tools.py reported for each CLI scenario.
+CLI = {
+    "cli-search": ([QUERY], ("picker", "mounted", "first-frame")),
+    "cli-stream": (["--stream", QUERY], ("picker", "first-result", "first-frame")),
+    "cli-title": (["-t", QUERY], ("picker", "preview", "first-frame")),
+    "cli-magnet": (None, ("mounted", "first-frame")),
+}
+PROCESS_TIMEOUT = 120
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def stage_search():
+    from btstrm.jackett import search_all
+
+    elapsed, store = timed(search_all, QUERY, progress=False)
+    return {"search_all (s)": elapsed, "results": len(store.ranked("seeds"))}
+
+
+def stage_titles():
+    from btstrm.posters import fetch_poster
+    from btstrm.tmdb import search_alternative_titles
+
+    elapsed, results = timed(search_alternative_titles, QUERY)
+    metrics = {"search_alternative_titles (s)": elapsed}
+    if results:
+        metrics["first poster (s)"], _ = timed(fetch_poster, results[0][0])
+        metrics["all posters (s)"], _ = timed(
+            lambda: [fetch_poster(url) for url, _ in results]
+        )
+    return metrics
+
+
+def stage_log():
+    from bench_log_parse import generate_log
+    from btstrm.btfs_log import LogFollower, parse_file
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, "log.txt")
+        n_lines = generate_log(log_file, int(os.environ["BENCH_LOG_MB"]))
+        size_mb = os.path.getsize(log_file) / (1024 * 1024)
+        parse, _ = timed(lambda: sum(1 for _ in parse_file(log_file)))
+        follow, _ = timed(LogFollower(log_file).poll)
+    return {
+        "parse_file (MB/s)": size_mb / parse,
+        "parse_file (lines/s)": n_lines / parse,
+        "LogFollower.poll (MB/s)": size_mb / follow,
+    }
+
+
+def stage_mount():
+    from btstrm import config
+    from fake_tools import player
+    from btstrm.mount import list_dirs, start_btfs, wait_until_ready
+    from btstrm.results import infohash_from_magnet
+
+    uri = os.environ["BENCH_MAGNET"]
+    ddir = os.path.join(config.cache_dir, "download")
+    os.makedirs(ddir, exist_ok=True)
+    mountpoint = tempfile.mkdtemp(prefix="btstrm-", dir=config.cache_dir)
+    started = time.perf_counter()
+    try:
+        before = list_dirs(ddir)
+        start_btfs(uri, mountpoint, ddir)
+        mounted = time.perf_counter() - started
+        wait_until_ready(
+            mountpoint, ddir, before, timeout=60, infohash=infohash_from_magnet(uri)
+        )
+        ready = time.perf_counter() - started
+        video = next(
+            os.path.join(d, n) for d, _, names in os.walk(mountpoint) for n in names
+        )
+        if player([video]) != 0:
+            raise RuntimeError(f"could not read the beginning of {video}")
+        first_frame = time.perf_counter() - started
+    finally:
+        subprocess.call(["fusermount", "-z", "-u", mountpoint])
+    return {
+        "start_btfs (s)": mounted,
+        "wait_until_ready (s)": ready,
+        "first-frame (s)": first_frame,
+    }
+
+
+STAGES = {
+    "search": stage_search,
+    "titles": stage_titles,
+    "log": stage_log,
+    "mount": stage_mount,
+}
+
+
+def write_environment(home, url, args):
+    """Config file and fake programs for btstrm, returns the environment."""
+    os.makedirs(os.path.join(home, ".config"), exist_ok=True)
+    with open(os.path.join(home, ".config", "btstrm.conf"), "w") as f:
+        f.write(
+            "[DEFAULT]\n"
+            f"JACKETT_URL = {url}\n"
+            "JACKETT_API_KEY = bench\n"
+            f"TMDB_URL = {url}\n"
+            f"SEARCH_DEADLINE = {args.deadline}\n"
+            "MOUNT_TIMEOUT = 60\n"
+            "STATUS_INTERVAL = 0.5\n"
+        )
+
+    bin_dir = os.path.join(home, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    fake_tools = os.path.join(BENCH_DIR, "fake_tools.py")
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake_tools}" {tool} "$@"\n')
+        os.chmod(path, 0o755)
+
+    env = dict(os.environ)
+    env.update(
+        HOME=home,
+        PATH=bin_dir + os.pathsep + env.get("PATH", ""),
+        PYTHONPATH=os.path.abspath(ROOT),
+        BENCH_LOG_MB=str(args.log_mb),
+        FAKE_BTFS_KBPS=str(args.kbps),
+        FAKE_BTFS_METADATA_DELAY=str(args.metadata_delay),
+        FAKE_BTFS_SIZE_MB=str(args.size_mb),
+        FAKE_BTFS_EPISODES="1",
+        FAKE_PLAYER_KB=str(args.first_frame_kb),
+    )
+    return env
+
+
+def run_process(command, env, marks_path, log_path):
+    """Run command, returns (seconds per mark, peak RSS in MB, exit status)."""
+    open(marks_path, "w").close()
+    env = dict(env, BENCH_MARKS=marks_path)
+    started = time.monotonic()
+    with open(log_path, "a") as log:
+        process = subprocess.Popen(
+            command, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=log
+        )
+    timer = threading.Timer(PROCESS_TIMEOUT, process.kill)
+    timer.start()
+    try:
+        _, wait_status, usage = os.wait4(process.pid, 0)
+    finally:
+        timer.cancel()
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    total = time.monotonic() - started
+
+    times = {}
+    with open(marks_path) as f:
+        for line in f:
+            event, stamp = line.split()
+            times.setdefault(event, float(stamp) - started)
+    times["total"] = total
+    return times, usage.ru_maxrss / 1024, process.returncode
+
+
+def run_scenario(name, env, home, magnet, log_path):
+    prefix = []
+    if name in MOUNTING and os.geteuid() != 0:
+        prefix = ["unshare", "--user", "--map-root-user", "--mount"]
+    marks_path = os.path.join(home, "marks")
+    if name in STAGES:
+        output_path = os.path.join(home, "stage.json")
+        command = prefix + [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--stage",
+            name,
+            "--output",
+            output_path,
+        ]
+    else:
+        cli_args, marks = CLI[name]
+        command = prefix + [
+            sys.executable,
+            "-m",
+            "btstrm",
+            "--no-daemon",
+            "-p",
+            "player",
+        ]
+        command += cli_args or [magnet]
+
+    env = dict(env, BENCH_MAGNET=magnet)
+    if name == "cli-title":
+        env["FAKE_FZF_PREVIEW"] = "1"
+    times, rss, status = run_process(command, env, marks_path, log_path)
+    if status != 0:
+        raise RuntimeError(f"{name} exited with status {status}, see {log_path}")
+
+    if name in STAGES:
+        with open(output_path) as f:
+            metrics = json.load(f)
+    else:
+        metrics = {f"{mark} (s)": times[mark] for mark in marks if mark in times}
+        metrics["total (s)"] = times["total"]
+    metrics["peak RSS (MB)"] = rss
+    return metrics
+
+
+def run_all(args):
+    services = FakeServices(size_mb=args.size_mb).start()
+    name, _, infohash = services.torrent("rarbg", 1)
+    magnet = f"magnet:?xt=urn:btih:{infohash}&dn={quote(name)}"
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="btstrm-bench-") as home:
+        env = write_environment(home, services.url, args)
+        log_path = os.path.join(home, "output.log")
+        cache_dir = os.path.join(home, ".cache", "btstrm")
+        try:
+            for scenario in args.only or SCENARIOS:
+                variants = (
+                    ("cold",) if scenario in ("log", "mount") else ("cold", "warm")
+                )
+                for variant in variants:
+                    key = scenario if len(variants) == 1 else f"{scenario} ({variant})"
+                    runs = []
+                    for _ in range(args.runs):
+                        if variant == "cold":
+                            shutil.rmtree(cache_dir, ignore_errors=True)
+                        runs.append(run_scenario(scenario, env, home, magnet, log_path))
+                    results[key] = {
+                        metric: [run[metric] for run in runs if metric in run]
+                        for metric in runs[0]
+                    }
+                    print_scenario(key, results[key], args.baseline)
+        except RuntimeError as e:
+            with open(log_path) as f:
+                sys.stderr.write(f.read()[-4000:])
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        finally:
+            services.stop()
+    return results
+
+
+def print_scenario(name, metrics, baseline):
+    previous = (baseline or {}).get(name, {})
+    for metric, values in metrics.items():
+        median = statistics.median(values)
+        line = f"{name:<20} {metric:<32} {median:>12,.3f} {min(values):>12,.3f}"
+        if metric in previous:
+            before = statistics.median(previous[metric])
+            change = (median - before) / before if before else 0.0
+            line += f" {before:>12,.3f} {change:>+8.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="runs per scenario")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, metavar="SCENARIO")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier --json run")
+    parser.add_argument("--deadline", type=float, default=3, help="SEARCH_DEADLINE")
+    parser.add_argument("--size-mb", type=float, default=256, help="torrent size")
+    parser.add_argument("--kbps", type=float, default=16384, help="fake btfs speed")
+    parser.add_argument(
+        "--metadata-delay",
+        type=float,
+        default=0.5,
+        help="seconds the fake btfs takes to show the files",
+    )
+    parser.add_argument("--first-frame-kb", type=float, default=4096)
+    parser.add_argument("--log-mb", type=int, default=50)
+    parser.add_argument("--stage", choices=sorted(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        metrics = STAGES[args.stage]()
+        with open(args.output, "w") as f:
+            json.dump(metrics, f)
+        return
+
+    args.baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            args.baseline = json.load(f)["results"]
+
+    header = f"{'scenario':<20} {'metric':<32} {'median':>12} {'min':>12}"
+    if args.baseline:
+        header += f" {'baseline':>12} {'change':>8}"
+    print(header)
+    results = run_all(args)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            settings = dict(vars(args), baseline=None)
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Guard the start-up cost of the btstrm entry point.
+
+Imports btstrm.btstrm in fresh interpreters with `python -X importtime`,
+reports the best cumulative import time and fails (exit status 1) if it
+exceeds the budget or if any heavy dependency is imported eagerly. Those
+are only needed for searching and for `-t`, not for playing a magnet link.
+The interpreters share a private bytecode cache, so that compiling the
+sources is not counted even where PYTHONDONTWRITEBYTECODE is set.
+
+CI runs it on every push, see .github/workflows/import-time.yml.
+
+Usage: python benchmarks/bench_import.py [--runs 5] [--budget-ms 25]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODULE = "btstrm.btstrm"
+HEAVY_MODULES = (
+    "requests",
+    "urllib3",
+    "bs4",
+    "tqdm",
+    "unidecode",
+    "colorama",
+    "concurrent.futures",
+    "xml.etree.ElementTree",
+    "hashlib",
+    "ctypes",
+)
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run(
+        [sys.executable, *args], env=env, capture_output=True, text=True, check=True
+    )
+
+
+def import_time_us():
+    """Cumulative import time of MODULE in microseconds, from -X importtime."""
+    result = run_python("-X", "importtime", "-c", f"import {MODULE}")
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == MODULE:
+            return int(parts[1])
+    raise RuntimeError(f"{MODULE} not found in -X importtime output")
+
+
+def eager_heavy_modules():
+    code = (
+        f"import sys, {MODULE}\n"
+        f"print('\\n'.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    return run_python("-c", code).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=25.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-import-") as pycache:
+        os.environ["PYTHONPYCACHEPREFIX"] = pycache
+        # The first run fills the bytecode cache and is not counted.
+        import_time_us()
+        times = sorted(import_time_us() for _ in range(args.runs))
+        eager = eager_heavy_modules()
+    best_ms = times[0] / 1000
+    median_ms = times[len(times) // 2] / 1000
+    print(f"import {MODULE}: best {best_ms:.1f} ms, median {median_ms:.1f} ms")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print(f"FAIL: import time above the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Compare the old per-line regex scan of btfs' log.txt with btstrm.btfs_log.
+
+Usage: python benchmarks/bench_log_parse.py [--mb 300] [--log path/to/log.txt]
+
+Without --log a synthetic log of the requested size is generated in a
+temporary directory and removed afterwards.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from btstrm.btfs_log import PieceFinished, TrackerAnnounce, parse_file  # noqa: E402
+
+LINES = (
+    "[{t:>8}] Big Buck Bunny: piece: {n} finished downloading\n",
+    "[{t:>8}] Big Buck Bunny: piece: {n} finished downloading\n",
+    "[{t:>8}] Big Buck Bunny: block finished: {n}\n",
+    "[{t:>8}] Big Buck Bunny: (udp://tracker{k}.example.org:6969/announce)"
+    "[10.0.0.{k}:6969] v1 received peers: {p}\n",
+    "[{t:>8}] Big Buck Bunny: (udp://tracker{k}.example.org:6969/announce)"
+    "[10.0.0.{k}:6969] v1 sending announce (started)\n",
+    "[{t:>8}] Big Buck Bunny: peer (10.1.{k}.{p}:51413) connecting to peer\n",
+    "[{t:>8}] Big Buck Bunny: file (0) error opening file: No such file\n",
+)
+
+
+def generate_log(path, size_mb):
+    target = size_mb * 1024 * 1024
+    rnd = random.Random(42)
+    written = 0
+    n = 0
+    with open(path, "w") as f:
+        while written < target:
+            chunk = []
+            for _ in range(10000):
+                line = rnd.choice(LINES).format(
+                    t=n, n=n % 5000, k=rnd.randrange(8), p=rnd.randrange(200)
+                )
+                chunk.append(line)
+                n += 1
+            data = "".join(chunk)
+            f.write(data)
+            written += len(data)
+    return n
+
+
+def old_parser(log_file):
+    """The loop read_log() used to run over the whole file every tick."""
+    trackers = {}
+    pieces = 0
+    first = False
+    with open(log_file, "r") as f:
+        for line in f.readlines():
+            match = re.search(r"\((.*?)\)\[.*?\].*?received .*?peers: (\d+)", line)
+            if match:
+                trackers[match.group(1)] = int(match.group(2))
+            if re.search(r"piece.*finished downloading", line):
+                pieces += 1
+            if re.search(r"piece: 0 finished downloading", line):
+                first = True
+    return pieces, sum(trackers.values()), first
+
+
+def new_parser(log_file):
+    trackers = {}
+    pieces = 0
+    first = False
+    for event in parse_file(log_file):
+        if type(event) is PieceFinished:
+            pieces += 1
+            first = first or event.index == 0
+        elif type(event) is TrackerAnnounce:
+            trackers[event.tracker] = event.peers
+    return pieces, sum(trackers.values()), first
+
+
+def bench(name, fn, log_file, n_lines):
+    start = time.perf_counter()
+    result = fn(log_file)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<8} {elapsed:8.2f}s {n_lines / elapsed:14,.0f} lines/s  result={result}"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=300, help="synthetic log size")
+    parser.add_argument("--log", help="benchmark an existing log.txt instead")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.log:
+            log_file = args.log
+            with open(log_file, "rb") as f:
+                n_lines = sum(1 for _ in f)
+        else:
+            log_file = os.path.join(tmp, "log.txt")
+            n_lines = generate_log(log_file, args.mb)
+        size_mb = os.path.getsize(log_file) / (1024 * 1024)
+        print(f"{n_lines:,} lines, {size_mb:.0f} MB")
+
+        old = bench("before", old_parser, log_file, n_lines)
+        new = bench("after", new_parser, log_file, n_lines)
+        if old != new:
+            print("Parsers disagree!", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
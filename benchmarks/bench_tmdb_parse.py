@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare the BeautifulSoup parse of TMDB search pages with btstrm.tmdb.
+
+Usage: python benchmarks/bench_tmdb_parse.py [--results 20] [--repeat 20]
+                                             [page.html ...]
+
+Saved pages (e.g. from `curl 'https://www.themoviedb.org/search?query=...'`)
+are benchmarked as given; without any, a synthetic page with the same
+poster markup and a comparable amount of surrounding HTML is generated.
+The BeautifulSoup side is skipped when bs4 is not installed.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from btstrm.tmdb import parse_html_for_posters_and_titles  # noqa: E402
+
+CARD = """
+<div class="card v4 tight" data-id="{n}" data-media-type="movie">
+  <div class="wrapper">
+    <div class="image"><div class="poster">
+      <a data-id="{n}" data-media-type="movie" class="result" href="/movie/{n}">
+        <img loading="lazy" class="poster w-[100%]"
+          src="https://media.themoviedb.org/t/p/w94_and_h141_bestv2/p{n}.jpg"
+          srcset="https://media.themoviedb.org/t/p/w94_and_h141_bestv2/p{n}.jpg 1x,
+                  https://media.themoviedb.org/t/p/w188_and_h282_bestv2/p{n}.jpg 2x"
+          alt="Big Buck Bunny {n} &amp; Friends &gt; Part {n}">
+      </a>
+    </div></div>
+    <div class="details">
+      <div class="title"><a href="/movie/{n}"><h2>Big Buck Bunny {n}</h2></a>
+        <span class="release_date">May 30, 2008</span></div>
+      <div class="overview"><p>{overview}</p></div>
+    </div>
+  </div>
+</div>
+"""
+OVERVIEW = "A giant rabbit takes revenge on three bullying rodents. " * 6
+NAVIGATION = (
+    '<li class="k-item"><a class="k-link" href="/movie/top-rated">'
+    '<span class="k-menu-link-text">Top Rated {n}</span></a></li>\n'
+)
+
+
+def synthetic_page(results):
+    head = "<html><head>" + '<script src="/assets/app.js"></script>\n' * 40
+    nav = "<body><nav><ul>" + "".join(NAVIGATION.format(n=n) for n in range(150))
+    cards = "".join(CARD.format(n=n, overview=OVERVIEW) for n in range(results))
+    return (
+        head + "</head>" + nav + "</ul></nav><main>" + cards + "</main></body></html>"
+    )
+
+
+def bs4_parser(html_content):
+    """The parse search_alternative_titles() used to run."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, "html.parser")
+    images = soup.select('img[loading][class="poster w-[100%]"][alt]')
+    results = []
+    for image in images:
+        srcset = image.get("srcset").split(",")[-1].strip().split(" ")[0]
+        title = image.get("alt").strip()
+        results.append((srcset, title))
+    return results
+
+
+def bench(name, fn, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(page) for page in pages]
+    elapsed = (time.perf_counter() - start) / (repeat * len(pages))
+    print(f"{name:<8} {elapsed * 1000:8.2f} ms/page  {sum(map(len, results))} posters")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*", help="saved TMDB search pages")
+    parser.add_argument("--results", type=int, default=20, help="synthetic posters")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, "r", errors="replace") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page(args.results)]
+    size_kb = sum(len(page) for page in pages) / 1024
+    print(f"{len(pages)} page(s), {size_kb:.0f} KB")
+
+    new = bench("after", parse_html_for_posters_and_titles, pages, args.repeat)
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        print("bs4 is not installed, skipping the comparison")
+        return
+    old = bench("before", bs4_parser, pages, args.repeat)
+    if old != new:
+        print("Parsers disagree!", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
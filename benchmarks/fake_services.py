@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Jackett's torznab API and TMDB, for offline benchmarks.
+
+Usage: python benchmarks/fake_services.py [--port 9117]
+                                          [--profile NAME:LATENCY:FAIL:RESULTS ...]
+
+Every indexer has a profile: it answers after LATENCY seconds, fails with
+HTTP 500 with probability FAIL and otherwise returns RESULTS results. The
+aggregate "all" indexer answers with the results of every indexer once the
+slowest one that did not fail would have. Download links of even results
+serve a .torrent file, odd ones redirect to a magnet link of the same
+torrent, like Jackett does for trackers that only publish magnets.
+
+/search is a TMDB search page with poster markup (see bench_tmdb_parse.py)
+whose posters are served from /t/p/. Point btstrm at the server with
+JACKETT_URL and TMDB_URL in ~/.config/btstrm.conf; bench_e2e.py does that
+in a temporary HOME.
+"""
+
+import argparse
+import collections
+import hashlib
+import http.server
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_tmdb_parse import synthetic_page  # noqa: E402
+from btstrm.bencode import info_hash  # noqa: E402
+
+PIECE_LENGTH = 1024 * 1024
+ITEM = (
+    "<item><title>{title}</title><link>{link}</link><size>{size}</size>"
+    "{source}"
+    '<torznab:attr name="seeders" value="{seeds}"/>'
+    '<torznab:attr name="peers" value="{peers}"/>'
+    '<torznab:attr name="infohash" value="{infohash}"/></item>'
+)
+
+
+class Profile:
+    def __init__(self, latency=0.0, fail_rate=0.0, results=50):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.results = results
+
+    @classmethod
+    def parse(cls, spec):
+        """(name, Profile) of a NAME:LATENCY:FAIL:RESULTS command line spec."""
+        name, latency, fail_rate, results = spec.split(":")
+        return name, cls(float(latency), float(fail_rate), int(results))
+
+
+# A typical Jackett: mostly quick indexers, one that always fails, one that
+# fails now and then and one slower than any sensible SEARCH_DEADLINE.
+DEFAULT_PROFILES = {
+    "rarbg": Profile(0.15, 0.0, 100),
+    "1337x": Profile(0.3, 0.0, 80),
+    "yts": Profile(0.1, 0.0, 20),
+    "eztv": Profile(0.4, 0.0, 60),
+    "nyaasi": Profile(0.2, 0.0, 40),
+    "torrentgalaxy": Profile(0.6, 0.0, 100),
+    "limetorrents": Profile(0.9, 0.0, 50),
+    "kickass": Profile(1.2, 0.0, 30),
+    "thepiratebay": Profile(0.5, 0.3, 100),
+    "zooqle": Profile(0.2, 1.0, 0),
+    "torlock": Profile(8.0, 0.0, 40),
+}
+
+
+def bencode(value):
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    items = sorted(
+        (k.encode("utf-8") if isinstance(k, str) else k, v) for k, v in value.items()
+    )
+    return b"d" + b"".join(bencode(k) + bencode(v) for k, v in items) + b"e"
+
+
+def make_torrent(name, files, piece_length=PIECE_LENGTH):
+    """
+    Bencoded .torrent with files, a list of (relative path, length). One
+    file makes a single-file torrent named after it.
+    """
+    total = sum(length for _, length in files)
+    pieces = b"".join(
+        hashlib.sha1(b"%s:%d" % (name.encode("utf-8"), i)).digest()
+        for i in range(-(-total // piece_length))
+    )
+    info = {"name": name, "piece length": piece_length, "pieces": pieces}
+    if len(files) == 1:
+        info["length"] = files[0][1]
+    else:
+        info["files"] = [
+            {"length": length, "path": path.split("/")} for path, length in files
+        ]
+    return bencode({"announce": "udp://tracker.example.org:6969", "info": info})
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type="text/xml", status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        services = self.server.services
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if url.path.startswith("/api/v2.0/indexers/") and len(parts) == 7:
+            services.count("torznab")
+            if query.get("t") == ["indexers"]:
+                self.send_body(services.indexers_xml())
+            else:
+                self.torznab(parts[3], query.get("q", [""])[0])
+        elif parts[0] == "dl" and len(parts) == 3:
+            services.count("download")
+            self.download(parts[1], int(parts[2]))
+        elif url.path == "/search":
+            services.count("tmdb")
+            time.sleep(services.tmdb_latency)
+            self.send_body(services.tmdb_page().encode("utf-8"), "text/html")
+        elif url.path.startswith("/t/p/"):
+            services.count("poster")
+            self.send_body(services.poster, "image/jpeg")
+        else:
+            self.send_body(b"not found", "text/plain", 404)
+
+    def torznab(self, indexer, search):
+        services = self.server.services
+        if indexer == "all":
+            answering = {
+                name: profile
+                for name, profile in services.profiles.items()
+                if not services.fails(profile)
+            }
+            latency = max((p.latency for p in answering.values()), default=0.0)
+        elif indexer in services.profiles:
+            profile = services.profiles[indexer]
+            answering = {} if services.fails(profile) else {indexer: profile}
+            latency = profile.latency
+        else:
+            self.send_body(b"unknown indexer", "text/plain", 404)
+            return
+
+        time.sleep(latency)
+        if not answering:
+            self.send_body(b"indexer error", "text/plain", 500)
+            return
+        items = "".join(
+            services.item(name, n, search, aggregate=indexer == "all")
+            for name, profile in answering.items()
+            for n in range(profile.results)
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:torznab="http://torznab.com/schemas/2015/feed">'
+            f"<channel>{items}</channel></rss>"
+        )
+        self.send_body(body.encode("utf-8"))
+
+    def download(self, indexer, n):
+        name, data, infohash = self.server.services.torrent(indexer, n)
+        if n % 2:
+            self.send_response(302)
+            self.send_header(
+                "Location", f"magnet:?xt=urn:btih:{infohash}&dn={quote(name)}"
+            )
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_body(data, "application/x-bittorrent")
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Twenty searches connect at once, more than the default backlog of 5.
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Searches past their deadline hang up before the answer is written.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServices:
+    def __init__(
+        self,
+        profiles=None,
+        size_mb=256,
+        episodes=1,
+        tmdb_results=20,
+        tmdb_latency=0.0,
+        poster_kb=30,
+        seed=42,
+    ):
+        self.profiles = dict(DEFAULT_PROFILES if profiles is None else profiles)
+        self.size = int(size_mb * 1024 * 1024)
+        self.episodes = episodes
+        self.tmdb_results = tmdb_results
+        self.tmdb_latency = tmdb_latency
+        self.poster = os.urandom(poster_kb * 1024)
+        self.hits = collections.Counter()
+        self._torrents = {}
+        self.server = None
+        self.url = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def start(self, port=0):
+        self.server = Server(("127.0.0.1", port), Handler)
+        self.server.services = self
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, kind):
+        with self._lock:
+            self.hits[kind] += 1
+
+    def fails(self, profile):
+        with self._lock:
+            return self._random.random() < profile.fail_rate
+
+    def indexers_xml(self):
+        indexers = "".join(
+            f'<indexer id="{escape(name)}" configured="true"/>'
+            for name in self.profiles
+        )
+        return f"<indexers>{indexers}</indexers>".encode("utf-8")
+
+    def torrent(self, indexer, n):
+        """(name, .torrent data, infohash) of result n of indexer."""
+        key = (indexer, n)
+        if key not in self._torrents:
+            self._torrents[key] = self._make_torrent(indexer, n)
+        return self._torrents[key]
+
+    def _make_torrent(self, indexer, n):
+        name = f"Big Buck Bunny {indexer} {n}"
+        if self.episodes > 1:
+            length = self.size // self.episodes
+            files = [
+                (f"Big Buck Bunny S01E{e + 1:02d}.mkv", length)
+                for e in range(self.episodes)
+            ]
+        else:
+            name += ".mkv"
+            files = [(name, self.size)]
+        data = make_torrent(name, files)
+        return name, data, info_hash(data)
+
+    def item(self, indexer, n, search, aggregate=False):
+        rnd = random.Random(f"{indexer}:{n}")
+        seeds = int(rnd.paretovariate(1.2)) - 1
+        name, _, infohash = self.torrent(indexer, n)
+        title = f"{unquote(search) or 'Big Buck Bunny'} {indexer} {n} 1080p"
+        source = (
+            f'<jackettindexer id="{escape(indexer)}">{escape(indexer)}</jackettindexer>'
+        )
+        return ITEM.format(
+            title=escape(title),
+            link=escape(f"{self.url}/dl/{indexer}/{n}"),
+            size=self.size,
+            source=source if aggregate else "",
+            seeds=seeds,
+            peers=seeds + rnd.randrange(50),
+            infohash=infohash,
+        )
+
+    def tmdb_page(self):
+        return synthetic_page(self.tmdb_results).replace(
+            "https://media.themoviedb.org", self.url
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9117)
+    parser.add_argument(
+        "--profile",
+        action="append",
+        type=Profile.parse,
+        metavar="NAME:LATENCY:FAIL:RESULTS",
+        help="indexer profile, replaces the default set of indexers",
+    )
+    parser.add_argument("--size-mb", type=float, default=256, help="torrent size")
+    parser.add_argument("--episodes", type=int, default=1, help="videos per torrent")
+    parser.add_argument("--tmdb-results", type=int, default=20)
+    parser.add_argument("--tmdb-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    services = FakeServices(
+        dict(args.profile) if args.profile else None,
+        size_mb=args.size_mb,
+        episodes=args.episodes,
+        tmdb_results=args.tmdb_results,
+        tmdb_latency=args.tmdb_latency,
+    ).start(args.port)
+    print(f"JACKETT_URL = {services.url}")
+    print(f"TMDB_URL = {services.url}")
+    for name, profile in services.profiles.items():
+        print(
+            f"  {name:<16} {profile.latency:5.2f}s  "
+            f"{profile.fail_rate:4.0%} failures  {profile.results} results"
+        )
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        services.stop()
+
+
+if __name__ == "__main__":
+    main()
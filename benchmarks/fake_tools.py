@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Stand-ins for the programs btstrm runs, for offline benchmarks.
+
+Usage: python benchmarks/fake_tools.py {btfs,fusermount,fzf,player,chafa} ARGS...
+
+bench_e2e.py puts a wrapper script for each of them on PATH.
+
+btfs         takes btfs' arguments, creates a btfs-XXXXXX data directory
+             with files/ and log.txt and bind-mounts files/ on the
+             mountpoint (so it needs root, or `unshare -rm`). After
+             FAKE_BTFS_METADATA_DELAY seconds the torrent's files appear
+             and grow piece by piece at FAKE_BTFS_KBPS, while log.txt gets
+             the tracker, block and piece lines libtorrent writes. It stays
+             in the background until the mountpoint is unmounted.
+fusermount   `fusermount -z -u MOUNTPOINT` as a lazy umount.
+fzf          selects line FAKE_FZF_PICK (default 0) as soon as it has been
+             read; with FAKE_FZF_PREVIEW=1 it first runs the --preview
+             command for that line.
+player       waits until the first FAKE_PLAYER_KB of the file can be read.
+chafa        does nothing.
+
+Each of them appends "<event> <time.monotonic()>" lines to $BENCH_MARKS:
+picker, first-result and preview from fzf, btfs, mounted and metadata from
+btfs, player and first-frame from the player.
+"""
+
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from btstrm.completion import TorrentLayout  # noqa: E402
+from btstrm.mount import is_mounted  # noqa: E402
+
+TRACKERS = 8
+BLOCK_SIZE = 16 * 1024
+
+
+def mark(event):
+    path = os.environ.get("BENCH_MARKS")
+    if path:
+        with open(path, "a") as f:
+            f.write(f"{event} {time.monotonic():.6f}\n")
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def torrent_files(uri):
+    """(name, [(relative path, length)], piece length) of the torrent uri."""
+    if uri.endswith(".torrent") and os.path.isfile(uri):
+        layout = TorrentLayout.from_file(uri)
+        files = [(path, length) for path, length, _ in layout.files]
+        return files[0][0].split("/")[0], files, layout.piece_length
+
+    # A magnet link says nothing about the files, they come from the
+    # environment bench_e2e.py shares with fake_services.py.
+    name = parse_qs(urlparse(uri).query).get("dn", ["Big Buck Bunny"])[0]
+    size = int(env_float("FAKE_BTFS_SIZE_MB", 256) * 1024 * 1024)
+    episodes = int(os.environ.get("FAKE_BTFS_EPISODES", 1))
+    if episodes > 1:
+        files = [
+            (f"{name}/Big Buck Bunny S01E{e + 1:02d}.mkv", size // episodes)
+            for e in range(episodes)
+        ]
+    else:
+        if not name.endswith(".mkv"):
+            name += ".mkv"
+        files = [(name, size)]
+    return name, files, 1024 * 1024
+
+
+def download(uri, files_dir, log, mountpoint):
+    """Write the torrent's pieces in order at FAKE_BTFS_KBPS, logging them."""
+    name, files, piece_length = torrent_files(uri)
+    rate = env_float("FAKE_BTFS_KBPS", 16384) * 1024
+    rnd = random.Random(42)
+    started = time.monotonic()
+
+    def log_lines(lines):
+        elapsed = int((time.monotonic() - started) * 1000)
+        log.write("".join(f"[{elapsed:>8}] {name}: {line}\n" for line in lines))
+        log.flush()
+
+    log_lines(
+        f"(udp://tracker{k}.example.org:6969/announce)[10.0.0.{k}:6969] "
+        "v1 sending announce (started)"
+        for k in range(TRACKERS)
+    )
+    if not sleep_while_mounted(mountpoint, env_float("FAKE_BTFS_METADATA_DELAY", 0.5)):
+        return
+    log_lines(
+        f"(udp://tracker{k}.example.org:6969/announce)[10.0.0.{k}:6969] "
+        f"v1 received peers: {rnd.randrange(200)}"
+        for k in range(TRACKERS)
+    )
+    mark("metadata")
+
+    handles = []
+    for path, _ in files:
+        full_path = os.path.join(files_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        handles.append(open(full_path, "wb"))
+
+    piece = b"\0" * piece_length
+    offset = 0
+    index = 0
+    try:
+        for handle, (_, length) in zip(handles, files):
+            written = 0
+            while written < length:
+                chunk = min(piece_length, length - written)
+                handle.write(piece[:chunk])
+                handle.flush()
+                written += chunk
+                offset += chunk
+                log_lines(
+                    [f"block finished: {b}" for b in range(chunk // BLOCK_SIZE)]
+                    + [
+                        f"peer (10.1.{rnd.randrange(8)}.{rnd.randrange(200)}:51413) "
+                        "connecting to peer",
+                        f"piece: {index} finished downloading",
+                    ]
+                )
+                index += 1
+                ahead = offset / rate - (time.monotonic() - started)
+                if not sleep_while_mounted(mountpoint, ahead):
+                    return
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def sleep_while_mounted(mountpoint, seconds):
+    """Sleep for seconds, returns False as soon as mountpoint is unmounted."""
+    deadline = time.monotonic() + seconds
+    while True:
+        if not is_mounted(mountpoint):
+            return False
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return True
+        time.sleep(min(left, 0.1))
+
+
+def btfs(argv):
+    keep = "--keep" in argv
+    args = [a for a in argv if a != "--keep"]
+    ddir = next(a.split("=", 1)[1] for a in args if a.startswith("--data-directory="))
+    uri, mountpoint = [a for a in args if not a.startswith("-")]
+    mark("btfs")
+
+    data_dir = tempfile.mkdtemp(prefix="btfs-", dir=ddir)
+    files_dir = os.path.join(data_dir, "files")
+    os.makedirs(files_dir)
+    if subprocess.call(["mount", "--bind", files_dir, mountpoint]) != 0:
+        print("fake btfs: bind mount failed, run as root or under `unshare -rm`")
+        return 1
+    mark("mounted")
+
+    # Like btfs, go into the background once mounted.
+    if os.fork():
+        return 0
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        with open(os.path.join(data_dir, "log.txt"), "w") as log:
+            download(uri, files_dir, log, mountpoint)
+        sleep_while_mounted(mountpoint, float("inf"))
+    finally:
+        if not keep:
+            subprocess.call(["rm", "-rf", data_dir])
+    return 0
+
+
+def fusermount(argv):
+    return subprocess.call(["umount", "-l", argv[-1]])
+
+
+def fzf(argv):
+    mark("picker")
+    pick = int(os.environ.get("FAKE_FZF_PICK", 0))
+    lines = []
+    for line in sys.stdin:
+        if not lines:
+            mark("first-result")
+        lines.append(line.rstrip("\n"))
+        if len(lines) > pick:
+            break
+    if len(lines) <= pick:
+        return 130
+    selected = lines[pick]
+
+    if os.environ.get("FAKE_FZF_PREVIEW") == "1" and "--preview" in argv:
+        command = argv[argv.index("--preview") + 1]
+        delimiter = (
+            argv[argv.index("--delimiter") + 1] if "--delimiter" in argv else None
+        )
+        fields = selected.split(delimiter)
+        for i, field in enumerate(fields, 1):
+            command = command.replace(f"{{{i}}}", shlex.quote(field))
+        command = command.replace("{}", shlex.quote(selected))
+        subprocess.call(
+            command, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        mark("preview")
+
+    print(selected)
+    return 0
+
+
+def player(argv):
+    mark("player")
+    wanted = int(env_float("FAKE_PLAYER_KB", 4096) * 1024)
+    deadline = time.monotonic() + env_float("FAKE_PLAYER_TIMEOUT", 60)
+    have = 0
+    with open(argv[-1], "rb") as f:
+        # btfs blocks reads until the pieces arrive, the fake one grows the
+        # file instead, so an empty read means "not yet".
+        while have < wanted:
+            data = f.read(wanted - have)
+            if data:
+                have += len(data)
+            elif time.monotonic() > deadline:
+                return 1
+            else:
+                time.sleep(0.01)
+    mark("first-frame")
+    return 0
+
+
+TOOLS = {
+    "btfs": btfs,
+    "fusermount": fusermount,
+    "fzf": fzf,
+    "player": player,
+    "chafa": lambda argv: 0,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in TOOLS:
+        print(__doc__.strip().splitlines()[2], file=sys.stderr)
+        sys.exit(2)
+    sys.exit(TOOLS[sys.argv[1]](sys.argv[2:]))
+
+
+if __name__ == "__main__":
+    main()
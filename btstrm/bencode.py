@@ -0,0 +1,84 @@
+"""
+Minimal bencode decoder for .torrent files.
+"""
+
+
+class BencodeError(ValueError):
+    pass
+
+
+def _decode(data, index):
+    token = data[index : index + 1]
+    if token == b"i":
+        end = data.index(b"e", index)
+        return int(data[index + 1 : end]), end + 1
+    if token == b"l":
+        index += 1
+        items = []
+        while data[index : index + 1] != b"e":
+            item, index = _decode(data, index)
+            items.append(item)
+        return items, index + 1
+    if token == b"d":
+        index += 1
+        items = {}
+        while data[index : index + 1] != b"e":
+            key, index = _decode(data, index)
+            if type(key) is not bytes:
+                raise BencodeError(f"dictionary key that is not a string at {index}")
+            items[key], index = _decode(data, index)
+        return items, index + 1
+    if token.isdigit():
+        colon = data.index(b":", index)
+        length = int(data[index:colon])
+        start = colon + 1
+        if start + length > len(data):
+            raise BencodeError("string runs past the end of the data")
+        return data[start : start + length], start + length
+    raise BencodeError(f"unexpected {token!r} at offset {index}")
+
+
+def decode(data):
+    """Decode bencoded bytes. Dictionary keys and strings stay bytes."""
+    try:
+        return _decode(data, 0)[0]
+    except BencodeError:
+        raise
+    except (IndexError, ValueError, TypeError) as e:
+        raise BencodeError(str(e)) from e
+    except RecursionError as e:
+        raise BencodeError("nested too deeply") from e
+
+
+def info_hash(data):
+    """
+    Hex SHA-1 of the bencoded info dictionary of .torrent data, i.e. its v1
+    infohash, or None if there is no info dictionary. The hash is taken
+    over the original bytes, so it does not depend on how they decode.
+    """
+    try:
+        if data[:1] != b"d":
+            raise BencodeError("not a dictionary")
+        index = 1
+        while data[index : index + 1] != b"e":
+            key, index = _decode(data, index)
+            if type(key) is not bytes:
+                raise BencodeError(f"dictionary key that is not a string at {index}")
+            start = index
+            _, index = _decode(data, index)
+            if key == b"info":
+                import hashlib
+
+                return hashlib.sha1(data[start:index]).hexdigest()
+    except BencodeError:
+        raise
+    except (IndexError, ValueError, TypeError) as e:
+        raise BencodeError(str(e)) from e
+    except RecursionError as e:
+        raise BencodeError("nested too deeply") from e
+    return None
+
+
+def decode_file(path):
+    with open(path, "rb") as f:
+        return decode(f.read())
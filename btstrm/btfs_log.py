@@ -0,0 +1,197 @@
+"""
+Parser and follower for the log.txt that btfs writes into its data directory.
+
+Every line is classified once, using cheap substring checks before any
+regular expression runs, and turned into an event. Consumers iterate over
+events instead of re-matching raw lines.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+
+# Longest partial line kept between reads. btfs never writes lines this long,
+# so anything bigger is garbage and is dropped to keep memory bounded.
+MAX_PARTIAL_LINE = 64 * 1024
+# Bytes of new log read and parsed at a time, however much was appended.
+READ_CHUNK = 1024 * 1024
+
+TrackerAnnounce = namedtuple("TrackerAnnounce", ["tracker", "peers"])
+PieceFinished = namedtuple("PieceFinished", ["index"])
+LogError = namedtuple("LogError", ["message"])
+
+tracker_re = re.compile(r"\((.*?)\)\[.*?\].*?received .*?peers: (\d+)")
+piece_index_re = re.compile(r"piece: (\d+) finished downloading")
+error_re = re.compile(r"\berror\b", re.IGNORECASE)
+
+
+def parse_line(line):
+    """Return the event described by a log line, or None for uninteresting lines."""
+    if "finished downloading" in line:
+        if "piece" not in line:
+            return None
+        match = piece_index_re.search(line)
+        return PieceFinished(int(match.group(1)) if match else None)
+
+    if "received" in line and "peers: " in line:
+        match = tracker_re.search(line)
+        if match:
+            return TrackerAnnounce(match.group(1), int(match.group(2)))
+
+    if "rror" in line and error_re.search(line):
+        return LogError(line.strip())
+
+    return None
+
+
+def parse_lines(lines):
+    for line in lines:
+        event = parse_line(line)
+        if event is not None:
+            yield event
+
+
+def parse_file(log_file):
+    with open(log_file, "r", errors="replace") as f:
+        yield from parse_lines(f)
+
+
+class LogFollower:
+    """
+    Follows the btfs log.txt the way `tail -F` does.
+
+    Only bytes appended since the previous poll are read and parsed, so the
+    cost of a status update is proportional to the number of new lines
+    rather than to the length of the session. Truncation and rotation of
+    the log are detected by size and inode and reading restarts from the
+    beginning of the new file. Counters are kept across both.
+    """
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.offset = 0
+        self.inode = None
+        self.partial = b""
+        self.trackers = {}
+        self.pieces_downloaded = 0
+        self.first_piece_downloaded = False
+        self.last_error = None
+        # Callables that receive every new event after the counters are updated.
+        self.listeners = []
+
+    @property
+    def peers(self):
+        return sum(self.trackers.values())
+
+    def _reopened(self, st):
+        """Detect rotation (new inode) or truncation (file shrank)."""
+        if self.inode is not None and st.st_ino != self.inode:
+            return True
+        return st.st_size < self.offset
+
+    def _read_new_lines(self):
+        """Lists of the complete lines appended since the last read, by chunk."""
+        with open(self.log_file, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(READ_CHUNK)
+                if not data:
+                    return
+                self.offset += len(data)
+
+                lines = (self.partial + data).split(b"\n")
+                self.partial = lines.pop()
+                if len(self.partial) > MAX_PARTIAL_LINE:
+                    self.partial = b""
+                yield [line.decode("utf-8", errors="replace") for line in lines]
+
+    def poll(self):
+        """
+        Parse lines appended since the last call and return how many events
+        they held. Returns None if btfs has not created the log yet. A long
+        backlog, e.g. of a mount reused by btstrmd, is read a chunk at a time.
+        """
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            return None
+
+        if self._reopened(st):
+            self.offset = 0
+            self.partial = b""
+        self.inode = st.st_ino
+
+        if st.st_size == self.offset:
+            return 0
+
+        count = 0
+        for lines in self._read_new_lines():
+            for event in parse_lines(lines):
+                self.apply(event)
+                for listener in self.listeners:
+                    listener(event)
+                count += 1
+        return count
+
+    def apply(self, event):
+        if type(event) is PieceFinished:
+            self.pieces_downloaded += 1
+            if event.index == 0:
+                self.first_piece_downloaded = True
+        elif type(event) is TrackerAnnounce:
+            self.trackers[event.tracker] = event.peers
+        elif type(event) is LogError:
+            self.last_error = event.message
+
+
+class LogMonitor:
+    """
+    Polls a LogFollower from a single background thread every `interval`
+    seconds and hands it to `on_update` whenever the log exists. The next
+    tick is scheduled only after the previous one finished, so slow polls
+    never overlap. A tick that fails does not stop the ones after it.
+    """
+
+    def __init__(self, follower, on_update, interval=2.0):
+        self.follower = follower
+        self.on_update = on_update
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="btstrm-log-monitor", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        last_error = None
+        while not self._stop.is_set():
+            try:
+                if self.follower.poll() is not None:
+                    self.on_update(self.follower)
+            except OSError:
+                # E.g. the log was rotated between stat() and open(), the
+                # next tick reads the new one.
+                pass
+            except Exception as e:
+                # A failing listener or status callback; reported once
+                # rather than on every tick.
+                if repr(e) != last_error:
+                    last_error = repr(e)
+                    print(
+                        f"Error following {self.follower.log_file}: {e}",
+                        file=sys.stderr,
+                    )
+            self._stop.wait(self.interval)
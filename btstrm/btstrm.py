@@ -1,83 +1,38 @@
 #!/usr/bin/env python3
 
-import requests
-from tqdm import tqdm
 import sys
-import math
 import os
 import os.path
-import threading
-import re
-from colorama import Fore
 import tempfile
 import shutil
-import time
 import subprocess
 from subprocess import call
-import xml.etree.ElementTree as ET
 import argparse
-from urllib.parse import urlparse
-from requests import get
-from urllib.parse import quote
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
-import concurrent.futures
-from unidecode import unidecode
-import configparser
 import atexit
 
-temp_files = []
+if __name__ == "__main__" and not __package__:
+    # Run as a script (python btstrm/btstrm.py), where this directory comes
+    # first on sys.path and "btstrm" would be this file instead of the package.
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+from btstrm import config, downloads
+from btstrm.btfs_log import LogFollower, LogMonitor
+from btstrm.config import config_bool
+from btstrm.bencode import BencodeError
+from btstrm.completion import CompletionTracker, TorrentLayout
+from btstrm.mount import list_dirs, start_btfs, wait_until_ready
+from btstrm.prefetch import MB, Prebuffer, natural_key, next_media, probe_bitrate
+from btstrm.results import GB, torrent_infohash
 
-class CaseSensitiveConfigParser(configparser.ConfigParser):
-    def optionxform(self, optionstr):
-        return optionstr
+# Search, TMDB and HTTP modules pull in requests, tqdm and unidecode, so
+# they are imported inside main() only on the code paths that need them.
 
-
-def load_config():
-    default_config = {
-        "LANG": "es-ES",
-        "JACKETT_API_KEY": "",
-        "JACKETT_URL": "http://127.0.0.1:9117",
-        "TIMEOUT": "30",
-        "REMOVE_PLAYED_FROM_LIST": "False",
-    }
-
-    config = CaseSensitiveConfigParser()
-
-    config_dir = os.path.join(os.path.expanduser("~"), ".config")
-
-    if not os.path.exists(config_dir):
-        os.makedirs(config_dir)
-
-    config_path = os.path.join(config_dir, "btstrm.conf")
-
-    if not os.path.exists(config_path):
-        print("Config file not found, creating one with default values...")
-
-        config["DEFAULT"] = default_config
-
-        with open(config_path, "w") as f:
-            config.write(f)
-
-    else:
-
-        try:
-            config.read(config_path)
-            for key in default_config.keys():
-                if key not in config["DEFAULT"]:
-                    raise KeyError(f"Key {key} missing from existing configuration.")
-                else:
-                    value = str(config.get("DEFAULT", key))
-                    globals()[key] = value
-
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-
-
-load_config()
 extensions = ("mp4", "m4v", "mkv", "avi", "mpg", "mpeg", "flv", "webm")
-home_dir = os.path.expanduser("~")
+home_dir = config.home_dir
+active_prebuffer = None
+prebuffer_pieces = ()
+next_prefetch = None
+completion = None
 players = (
     ("omxplayer", "--timeout", "60"),
     ("mpv", "--really-quiet", "--cache=no"),
@@ -86,76 +41,6 @@ players = (
 )
 
 
-# TMDB helper functions
-def fetch_movie_data(search_term, language=LANG):
-    QUERY = quote(search_term)
-    url = f"https://www.themoviedb.org/search?query={QUERY}&language={language}"
-
-    headers = {
-        "Accept-Encoding": "gzip, deflate, br",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; rv:122.0) Gecko/20100101 Firefox/122.0",
-    }
-
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.text
-    else:
-        print(f"Failed to fetch data from TMDB. Status code: {response.status_code}")
-        return ""
-
-
-def parse_html_for_posters_and_titles(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
-    images = soup.select('img[loading][class="poster w-[100%]"][alt]')
-    results = []
-    for image in images:
-        srcset = image.get("srcset").split(",")[-1].strip().split(" ")[0]
-        title = image.get("alt").strip()
-        results.append((srcset, title))
-    return results
-
-
-def search_alternative_titles(search_term):
-    html_content = fetch_movie_data(search_term)
-    results = parse_html_for_posters_and_titles(html_content)
-    return results
-
-
-def load_image(image_url):
-    response = requests.get(image_url, stream=True)
-    response.raise_for_status()
-
-    temp_filename = os.path.join(
-        tempfile.gettempdir(), next(tempfile._get_candidate_names()) + ".jpg"
-    )
-
-    with open(temp_filename, "wb") as f:
-        shutil.copyfileobj(response.raw, f)
-
-    temp_files.append(temp_filename)
-
-    return temp_filename
-
-
-def load_images_threaded(urls):
-    images = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(load_image, url): url for url in urls}
-        for future in tqdm(
-            concurrent.futures.as_completed(futures),
-            total=len(urls),
-            desc="Loading images",
-            ncols=70,
-        ):
-            try:
-                tmp_file_name = future.result()
-                url = futures[future]
-                images.append((tmp_file_name, url))
-            except Exception as e:
-                print(f"Error loading image: {e}")
-    return sorted(images, key=lambda x: urls.index(x[1]))
-
-
 def which(x):
     for d in os.getenv("PATH", "").split(":"):
         if os.path.exists(os.path.join(d, x)):
@@ -187,154 +72,6 @@ def exit(tempdir, status):
     sys.exit(status)
 
 
-def get_jackett_indexers():
-    try:
-        response = requests.get(
-            f"{JACKETT_URL}/api/v2.0/indexers/all/results/torznab/api?apikey={JACKETT_API_KEY}&t=indexers&configured=true"
-        )
-        response.raise_for_status()
-        xml_response = ET.fromstring(response.content)
-        indexers = [indexer.get("id") for indexer in xml_response.findall(".//indexer")]
-        return indexers
-    except requests.exceptions.RequestException as e:
-        print(f"Error retrieving indexers: {e}")
-        return []
-
-
-def search_torrents(query, indexer):
-    torrents = []
-    try:
-        response = requests.get(
-            f"{JACKETT_URL}/api/v2.0/indexers/{indexer}/results/torznab/api?apikey={JACKETT_API_KEY}&q={query}",
-            timeout=int(TIMEOUT),
-        )
-        response.raise_for_status()
-        xml_response = ET.fromstring(response.content)
-
-        items = xml_response.findall(".//item")
-
-        for item in items:
-            title = (
-                item.find("title").text
-                if item.find("title") is not None
-                else "No Title"
-            )
-            link = (
-                item.find("link").text if item.find("link") is not None else "No Link"
-            )
-            seeds_str = (
-                item.find("*[@name='seeders']").get("value")
-                if item.find("*[@name='seeders']") is not None
-                else "0"
-            )
-            seeds_int = int(seeds_str)
-            size_bytes_str = (
-                item.find("size").text if item.find("size") is not None else "0"
-            )
-            size_bytes_int = int(size_bytes_str)
-            size_human_readable = "%.2f GB" % (size_bytes_int / (1024 * 1024 * 1024))
-            title_with_tracker_name = f"{title} [{indexer}]"
-            torrents.append(
-                {
-                    "title": title_with_tracker_name,
-                    "seeds": seeds_int,
-                    "size": size_human_readable,
-                    "link": link,
-                }
-            )
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error searching torrents for indexer {indexer}: {e}")
-
-    return torrents
-
-
-def normalize_query(query):
-    ascii_query = unidecode(query)
-    return ascii_query
-
-
-def search_torrents_threaded(query, indexer):
-    non_ascii_letters = [
-        "á",
-        "é",
-        "í",
-        "ó",
-        "ú",
-        "ü",
-        "ñ",
-        "ç",
-        "à",
-        "è",
-        "ì",
-        "ò",
-        "ù",
-        "â",
-        "ê",
-        "î",
-        "ô",
-        "û",
-        "ä",
-        "ë",
-        "ï",
-        "ö",
-        "ü",
-        "ÿ",
-        "ø",
-        "å",
-        "æ",
-        "œ",
-        "ß",
-        "ð",
-        "þ",
-        "ł",
-        "ž",
-        "š",
-        "ý",
-    ]
-
-    if any(letter in query for letter in non_ascii_letters):
-        ascii_query = normalize_query(query)
-        torrents = search_torrents(query, indexer) + search_torrents(
-            ascii_query, indexer
-        )
-    else:
-        torrents = search_torrents(query, indexer)
-
-    torrents_unique = list({v["link"]: v for v in torrents}.values())
-    return torrents_unique
-
-
-def call_fzf_with_results(results):
-    with tempfile.NamedTemporaryFile(mode="w+", delete=True) as temp_file:
-        for result in results:
-            temp_file.write(
-                f"{result['title']}\t{result['seeds']}\t{result['size']}\t{result['link']}\n"
-            )
-        temp_file.flush()
-
-        selected = subprocess.check_output(
-            [
-                "fzf",
-                "--height=20",
-                "--no-sort",
-                "--delimiter",
-                "\t",
-                "--with-nth",
-                "1,2,3",
-                "--preview",
-                'echo {} | awk -F\'\t\' \'{print "\\033[1mName:\\033[0m ", $1, "\\n\\033[1mSeeders:\\033[0m ", $2, "\\n\\033[1mSize:\\033[0m ", $3}\'',
-                "--preview-window",
-                "right:wrap",
-                "-q",
-                "",
-            ],
-            stdin=open(temp_file.name),
-        )
-
-        return selected.decode("utf-8").split("\t")[-1]
-
-
 def scan(directory, indent=""):
     completed_files = []
     try:
@@ -344,6 +81,8 @@ def scan(directory, indent=""):
                 completed_files.extend(scan(absolute_path, indent + "    "))
             else:
                 file_stat = os.stat(absolute_path)
+                if file_stat.st_size == 0:
+                    continue
                 progress = round(
                     100.0 * 512.0 * file_stat.st_blocks / file_stat.st_size, 0
                 )
@@ -367,45 +106,126 @@ def add_to_playlist(completed_files):
         print(f"Error: {e}")
 
 
-def read_log(log_file):
-    trackers = {}
-    total_pieces_downloaded = 0
-    first_piece_downloaded = False
-    if os.path.exists(log):
-        with open(log_file, "r") as f:
-            for line in f.readlines():
-                match = re.search(r"\((.*?)\)\[.*?\].*?received .*?peers: (\d+)", line)
-                if match:
-                    tracker = match.group(1)
-                    peers_count = int(match.group(2))
-                    trackers[tracker] = peers_count
-
-                if re.search(r"piece.*finished downloading", line):
-                    total_pieces_downloaded += 1
-
-                if re.search(r"piece: 0 finished downloading", line):
-                    first_piece_downloaded = True
-
-        total_peers_counts_for_unique_trackers_last_occurrence = sum(trackers.values())
-        # total_downloaded_MBs = round(total_pieces_downloaded * .25,2)
+def print_status(follower):
+    from colorama import Fore
 
-        output_str = ""
+    if follower.first_piece_downloaded:
+        color = Fore.GREEN
+    else:
+        color = Fore.LIGHTBLACK_EX
 
-        if first_piece_downloaded:
-            output_str = (
-                Fore.GREEN
-                + f"Peers: {total_peers_counts_for_unique_trackers_last_occurrence}; Downloaded {total_pieces_downloaded} pieces"
-            )
+    output_str = (
+        color
+        + f"Peers: {follower.peers}; Downloaded {follower.pieces_downloaded} pieces"
+    )
+    if completion:
+        output_str += (
+            f"; Complete files: {len(completion.completed)}/{completion.total_files}"
+        )
+    buffer = active_prebuffer
+    if buffer and not buffer.done.is_set():
+        if prebuffer_pieces:
+            finished = completion.count_finished(prebuffer_pieces)
+            output_str += f"; Buffering {finished}/{len(prebuffer_pieces)} pieces"
         else:
-            output_str = (
-                Fore.LIGHTBLACK_EX
-                + f"Peers: {total_peers_counts_for_unique_trackers_last_occurrence}; Downloaded {total_pieces_downloaded} pieces"
+            output_str += (
+                f"; Buffering {buffer.buffered // MB}/{buffer.target // MB} MB"
             )
 
-        sys.stdout.write("\r" + " " * 80 + "\r" + output_str)
-        sys.stdout.flush()
+    sys.stdout.write("\r" + " " * 80 + "\r" + output_str)
+    sys.stdout.flush()
+
+
+def prebuffer(path, head_mb, mountpoint):
+    """Warm up the start and end of path through the mount before playing it."""
+    global active_prebuffer, prebuffer_pieces
+
+    if active_prebuffer:
+        active_prebuffer.stop()
+
+    head_bytes = int(head_mb * MB)
+    seconds = float(config.PREBUFFER_SECONDS)
+    if seconds > 0:
+        bitrate = probe_bitrate(path)
+        if bitrate:
+            head_bytes = max(head_bytes, int(bitrate / 8 * seconds))
+    tail_bytes = int(float(config.PREBUFFER_TAIL_MB) * MB)
+
+    buffer = Prebuffer(path, head_bytes, tail_bytes)
+    # Progress comes from the pieces btfs reports as finished, reads through
+    # the mount only return once a whole piece has arrived anyway.
+    prebuffer_pieces = ()
+    if completion:
+        relative = os.path.relpath(path, mountpoint)
+        prebuffer_pieces = sorted(
+            {
+                index
+                for start, end in buffer.ranges
+                for index in completion.layout.byte_pieces(relative, start, end)
+            }
+        )
+    active_prebuffer = buffer.start()
+    active_prebuffer.wait(timeout=float(config.PREBUFFER_TIMEOUT))
+    return active_prebuffer
+
+
+def prefetch_next(media, current, local_copies, mountpoint):
+    """
+    Warm up the episode after current through the mount while current plays,
+    throttled to PREFETCH_NEXT_KBPS so that it does not starve the player.
+    """
+    global next_prefetch
+
+    if next_prefetch:
+        next_prefetch.stop()
+        next_prefetch = None
+    head_bytes = int(float(config.PREFETCH_NEXT_MB) * MB)
+    upcoming = next_media(media, current)
+    if not head_bytes or not upcoming:
+        return None
+    if os.path.relpath(upcoming, mountpoint) in local_copies:
+        return None
+    try:
+        next_prefetch = Prebuffer(
+            upcoming,
+            head_bytes,
+            int(float(config.PREBUFFER_TAIL_MB) * MB),
+            rate=float(config.PREFETCH_NEXT_KBPS) * 1024,
+            delay=float(config.PREFETCH_NEXT_DELAY),
+        ).start()
+    except OSError:
+        return None
+    return next_prefetch
+
+
+def subtitle_options(player, data_path, subtitles, files_dir):
+    """
+    mpv options for the subtitles of the file at data_path, built right
+    before it is played: btfs creates the torrent's directories, and osd
+    adds subtitles, while earlier files play. mpv looks in every directory
+    of the torrent, e.g. Subs/ next to Episodes/, starting with the file's
+    own, which a kept copy may have outside files_dir.
+    """
+    if "mpv" not in player[0]:
+        return []
+    directory = os.path.dirname(data_path)
+    directories = [directory] + [
+        dirpath for dirpath, _, _ in os.walk(files_dir) if dirpath != directory
+    ]
+    options = [f"--sub-file-paths={':'.join(directories)}"]
+    if subtitles:
+        options += [f"--sub-file={s}" for s in subtitles.fetched.get(data_path, [])]
+    return options
 
-        threading.Timer(2, read_log, [log_file]).start()  # run every 2 seconds
+
+def print_connection_stats():
+    from btstrm import net
+
+    for stat in net.connection_stats():
+        print(
+            f"{stat['host']}: {stat['requests']} requests over {stat['connections']} connections",
+            file=sys.stderr,
+        )
 
 
 def cleanup(mount_point):
@@ -413,20 +233,65 @@ def cleanup(mount_point):
         subprocess.call(["fusermount", "-z", "-u", mount_point], stderr=DEVNULL)
 
 
-def cleanup_temp_files():
-    for filepath in temp_files:
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Error deleting {filepath}: {e}")
+def load_layout(uri):
+    """TorrentLayout of a local .torrent file, or None (e.g. for magnets)."""
+    if not (uri.endswith(".torrent") and os.path.isfile(uri)):
+        return None
+    try:
+        return TorrentLayout.from_file(uri)
+    except (OSError, BencodeError, KeyError, AttributeError, TypeError) as e:
+        print(f"Could not read {uri}: {e}", file=sys.stderr)
+        return None
+
+
+def layout_media(layout):
+    """Paths relative to the mountpoint and sizes of the videos in layout."""
+    found = sorted(
+        (
+            (path, length)
+            for path, length, padding in layout.files
+            if not padding and is_video(path) and not is_sample(path)
+        ),
+        key=lambda item: natural_key(item[0]),
+    )
+    return [path for path, _ in found], dict(found)
 
 
-atexit.register(cleanup_temp_files)
+def media_sizes(media, sizes, mountpoint):
+    """Sizes of the media on the mount, by path relative to mountpoint."""
+    found = {}
+    for path in media:
+        size = sizes.get(path)
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+        found[os.path.relpath(path, mountpoint)] = size
+    return found
+
+
+def pick_media(media, sizes):
+    """Let the user choose one of media with fzf, returns its index or None."""
+    lines = []
+    for index, path in enumerate(media):
+        line = f"{index}: {os.path.basename(path)}"
+        if path in sizes:
+            line += "  (%.2f GB)" % (sizes[path] / GB)
+        lines.append(line)
+    process = subprocess.Popen(
+        ["fzf", "--with-nth", "2.."],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    selected, _ = process.communicate(input="\n".join(lines).encode("utf-8"))
+    if process.returncode != 0:
+        return None
+    return int(selected.decode("utf-8").split(":")[0])
 
 
 def main():
-    global log
+    global log, completion
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--player", action="store", help="player to launch")
     parser.add_argument(
@@ -446,6 +311,50 @@ def main():
         default=False,
         help="Download subtitles using osd program",
     )
+    parser.add_argument(
+        "-b",
+        "--prebuffer",
+        type=float,
+        metavar="MB",
+        help="read this many MB of the file ahead before starting the player",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ignore cached indexers, search results and TMDB titles",
+    )
+    parser.add_argument(
+        "-a",
+        "--aggregate",
+        action="store_true",
+        help="search all indexers with a single request to Jackett",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=("seeds", "size", "score"),
+        default=None,
+        help="rank search results by seeders, size or seeders per GB (score)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="open fzf immediately and add results as each indexer replies",
+    )
+    parser.add_argument(
+        "--indexer-stats",
+        action="store_true",
+        help="show latency, error rate and result counts per indexer and exit",
+    )
+    parser.add_argument(
+        "--http-stats",
+        action="store_true",
+        help="print HTTP connection reuse statistics on exit",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="do not use a running btstrmd, search and mount in this process",
+    )
     parser.add_argument(
         "URI",
         nargs="?",
@@ -455,40 +364,52 @@ def main():
     )
     args = parser.parse_args()
 
+    use_daemon = False
+    if not args.no_daemon and os.path.exists(config.daemon_socket):
+        from btstrm import daemon
+
+        use_daemon = daemon.available()
+
+    if args.http_stats:
+        atexit.register(print_connection_stats)
+
+    if args.indexer_stats:
+        from btstrm.jackett import print_indexer_stats
+
+        print_indexer_stats()
+        return
+
     if args.title:
-        results = search_alternative_titles(args.title)
+        from btstrm.posters import preview_command
+        from btstrm.tmdb import search_alternative_titles
+
+        results = search_alternative_titles(args.title, refresh=args.refresh)
         if not results:
             print("No alternative titles found.")
             return
 
-        poster_urls = [srcset for srcset, _ in results]
-        loaded_posters = load_images_threaded(poster_urls)
-
-        with tempfile.NamedTemporaryFile(mode="w+", delete=True) as temp_file:
-            for (srcset, title), (poster_file, _) in zip(results, loaded_posters):
-                temp_file.write(f"{poster_file}\t{title}\n")
-            temp_file.flush()
-
-            selected_title = subprocess.check_output(
-                [
-                    "fzf",
-                    "--height=20",
-                    "--no-sort",
-                    "--delimiter",
-                    "\t",
-                    "--with-nth",
-                    "2",
-                    "--preview",
-                    "echo {} | awk -F'\t' '{print $1}' | xargs -I{} sh -c 'chafa -s x20 --format=symbols {}'",
-                    "-q",
-                    "",
-                ],
-                stdin=open(temp_file.name),
-            )
+        # Posters are fetched by the preview command as they are shown.
+        selection_list = "".join(f"{srcset}\t{title}\n" for srcset, title in results)
+        selected_title = subprocess.check_output(
+            [
+                "fzf",
+                "--height=20",
+                "--no-sort",
+                "--delimiter",
+                "\t",
+                "--with-nth",
+                "2",
+                "--preview",
+                preview_command(),
+                "-q",
+                "",
+            ],
+            input=selection_list.encode("utf-8"),
+        )
 
-            query = (
-                selected_title.decode("utf-8").strip().split("\t")[1]
-            )  # Get only the title part from selection
+        query = (
+            selected_title.decode("utf-8").strip().split("\t")[1]
+        )  # Get only the title part from selection
     elif args.URI:
         query = args.URI
         uri = args.URI
@@ -499,45 +420,59 @@ def main():
         not (
             query.startswith("magnet:")
             or query.endswith(".torrent")
-            or query.startswith("http://127.0.0.1:9117")
+            or query.startswith(("http://", "https://"))
         )
         and query
     ):
-        indexers = get_jackett_indexers()
-        all_torrents = []
-
-        with tqdm(total=len(indexers), desc="Searching torrents", ncols=70) as pbar:
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = {
-                    executor.submit(search_torrents_threaded, query, indexer): indexer
-                    for indexer in indexers
-                }
-                for future in concurrent.futures.as_completed(futures):
-                    torrents = future.result()
-                    all_torrents.extend(torrents)
-                    pbar.update()
-
-            pbar.close()
-
-        all_torrents.sort(key=lambda x: x["seeds"], reverse=True)
-
-        if all_torrents:
-            uri = call_fzf_with_results(all_torrents)
+        from btstrm.jackett import search_all
+        from btstrm.picker import call_fzf_with_results, stream_results_to_fzf
+        from btstrm.results import SORT_KEYS, Torrent
+
+        aggregate = args.aggregate or config_bool(config.JACKETT_AGGREGATE)
+        sort_by = args.sort or config.SORT_BY
+        if sort_by not in SORT_KEYS:
+            sort_by = "seeds"
+
+        if args.stream or config_bool(config.STREAM_RESULTS):
+            uri = stream_results_to_fzf(query, args.refresh, aggregate, sort_by)
+            if not uri:
+                print("No torrent selected.")
+                return
             print(uri)
         else:
-            print("No torrents found.")
-            return
+            all_torrents = None
+            if use_daemon:
+                try:
+                    reply = daemon.request(
+                        "search",
+                        query=query,
+                        refresh=args.refresh,
+                        aggregate=aggregate,
+                        sort_by=sort_by,
+                    )
+                    all_torrents = [Torrent.from_dict(t) for t in reply["results"]]
+                except (OSError, ValueError, daemon.DaemonError) as e:
+                    print(f"btstrmd search failed, searching here: {e}")
+            if all_torrents is None:
+                all_torrents = search_all(query, args.refresh, aggregate).ranked(
+                    sort_by
+                )
+
+            if all_torrents:
+                uri = call_fzf_with_results(all_torrents)
+                print(uri)
+            else:
+                print("No torrents found.")
+                return
 
-    if uri.startswith("http://127.0.0.1:9117"):
-        response = get(uri, allow_redirects=False)
-        content_type = response.headers.get("Content-Type")
+    if uri.startswith(("http://", "https://")):
+        from btstrm import net, resolver
 
-        if content_type == "application/x-bittorrent":
-            with open("/tmp/temp.torrent", "wb") as f:
-                f.write(response.content)
-            uri = "/tmp/temp.torrent"
-        elif "Location" in response.headers:
-            uri = response.headers["Location"]
+        try:
+            uri = resolver.resolve(uri)
+        except (resolver.ResolveError, OSError) + net.NETWORK_ERRORS as e:
+            print(f"Could not resolve {uri}: {e}", file=sys.stderr)
+            sys.exit(2)
 
     player = find_player([args.player.split()] if args.player else players)
 
@@ -545,101 +480,198 @@ def main():
         print("Could not find a player", file=sys.stderr)
         return
 
-    mount_dir = os.path.join(os.environ["HOME"], ".cache", "btstrm")
-    ddir = os.path.join(mount_dir, "download")
-    os.makedirs(mount_dir, exist_ok=True)
-    os.makedirs(ddir, exist_ok=True)
-    mountpoint = tempfile.mkdtemp(prefix="btstrm-", dir=mount_dir)
-
-    # atexit
-    atexit.register(lambda: cleanup(mountpoint))
-    # atexit.register(cleanup_temp_files)
+    # With a .torrent file the media is known before anything is mounted.
+    layout = load_layout(uri)
+    media, sizes = layout_media(layout) if layout else ([], {})
+
+    # Files an earlier --keep session downloaded completely are played from
+    # disk; btfs is only mounted if something else is needed.
+    infohash = torrent_infohash(uri)
+    kept = downloads.lookup(infohash) if infohash else None
+    local_copies = {}
+    if kept:
+        # Without a layout, only the videos listed when the torrent was kept
+        # are known; entries from before they were recorded list the mount.
+        if not layout and kept.get("media"):
+            media = sorted(kept["media"], key=natural_key)
+            sizes = dict(kept["media"])
+        local_copies = downloads.local_copies(kept)
+    local = bool(media) and all(path in local_copies for path in media)
+
+    selected_index = None
+    if len(media) > 1:
+        selected_index = pick_media(media, sizes)
+        if selected_index is None:
+            print("Exiting.")
+            return
 
-    if args.keep:
-        failed = subprocess.call(
-            ["btfs", "--keep", f"--data-directory={ddir}", uri, mountpoint]
-        )
+    lease = None
+    if local:
+        # Any kept directory does, the files are played from local_copies.
+        kept_dir = kept["complete"][media[selected_index or 0]]
+        mountpoint = os.path.join(kept_dir, "files")
+        print(f"Playing the files kept in {', '.join(kept['dirs'])}")
+    elif use_daemon:
+        # btstrmd keeps the mount for later runs, it is in use while the
+        # lease connection stays open.
+        try:
+            lease = daemon.connect()
+            reply = daemon.send_request(
+                lease,
+                "mount",
+                uri=os.path.abspath(uri) if os.path.isfile(uri) else uri,
+                keep=args.keep,
+            )
+        except (OSError, ValueError, daemon.DaemonError) as e:
+            if lease:
+                lease.close()
+            print("Error:", e, file=sys.stderr)
+            sys.exit(2)
+        mountpoint = reply["mountpoint"]
     else:
-        failed = subprocess.call(["btfs", f"--data-directory={ddir}", uri, mountpoint])
+        mount_dir = config.cache_dir
+        ddir = os.path.join(mount_dir, "download")
+        os.makedirs(mount_dir, exist_ok=True)
+        os.makedirs(ddir, exist_ok=True)
+        mountpoint = tempfile.mkdtemp(prefix="btstrm-", dir=mount_dir)
+
+        # atexit
+        atexit.register(lambda: cleanup(mountpoint))
+        # atexit.register(cleanup_temp_files)
+
+        # Snapshot taken before btfs creates its data directory, see wait_until_ready().
+        existing_dirs = list_dirs(ddir)
+
+        failed = start_btfs(uri, mountpoint, ddir, args.keep)
+        if failed:
+            exit(mountpoint, failed)
+            return
 
-    if failed:
-        exit(mountpoint, failed)
-        return
+    media = [os.path.join(mountpoint, path) for path in media]
+    sizes = {os.path.join(mountpoint, path): size for path, size in sizes.items()}
 
+    monitor = None
+    subtitles = None
+    ipc_dir = None
+    data_dir = None
+    torrent_media = None
     try:
-        while not os.listdir(mountpoint):
-            time.sleep(0.25)
+        if local:
+            data_dir = kept_dir
+        elif lease:
+            data_dir = reply["data_dir"]
+        else:
+            data_dir = wait_until_ready(
+                mountpoint,
+                ddir,
+                existing_dirs,
+                timeout=float(config.MOUNT_TIMEOUT),
+                infohash=infohash,
+            )
+        log = data_dir + "/log.txt"
 
-        subdirs = [
-            os.path.join(ddir, d)
-            for d in os.listdir(ddir)
-            if os.path.isdir(os.path.join(ddir, d))
-        ]
-        last_created_dir = max(subdirs, key=os.path.getmtime)
-        log = last_created_dir + "/log.txt"
+        if not local and (not media or not os.path.exists(media[0])):
+            media = sorted(
+                (i for i in find_files(mountpoint) if not is_sample(i) and is_video(i)),
+                key=natural_key,
+            )
+            sizes = {}
+            selected_index = None
 
-        media = sorted(
-            i for i in find_files(mountpoint) if not is_sample(i) and is_video(i)
-        )
+        if not local:
+            torrent_media = media_sizes(media, sizes, mountpoint)
 
         mountpoint_removed = [m.replace(mountpoint, "") for m in media]
-        file_paths = [last_created_dir + "/files" + m for m in mountpoint_removed]
+        # Files played from disk get their subtitles next to the kept copy.
+        file_paths = [
+            local_copies.get(m.lstrip("/"), data_dir + "/files" + m)
+            for m in mountpoint_removed
+        ]
 
         # for file_path in file_paths:
         #     print(file_path)
 
-        read_log(log)
-
-        if args.subtitles is not False:
-            for file_path in file_paths:
-                while not os.path.exists(file_path):
-                    time.sleep(1)
-
-                # If there is a subtitle name provided.
-                if args.subtitles != "":
-                    result = subprocess.run(
-                        ["osd", file_path], stderr=subprocess.PIPE, text=True
-                    )
-
-                    if "No subtitles found." in result.stderr:
-                        subprocess.run(["osd", "-c", args.subtitles, file_path])
-
-                else:  # Case when -s/--subtitle was passed with no argument.
-                    subprocess.run(["osd", file_path])
-
-        if "mpv" in player[0]:
-            sub_option = f'--sub-file-paths={":".join([dirpath for dirpath, _, _ in os.walk(last_created_dir + "/files")])}'
-            player_with_options = list(player) + [sub_option]
-        else:
-            # For other players, just use original command.
-            player_with_options = list(player)
+        if not local:
+            follower = LogFollower(log)
+            completion = CompletionTracker(layout) if layout else None
+            if completion:
+                follower.listeners.append(completion.apply)
+            monitor = LogMonitor(
+                follower, print_status, interval=float(config.STATUS_INTERVAL)
+            ).start()
+
+        player_with_options = list(player)
+
+        if args.subtitles is not False and not which("osd"):
+            print("osd not found in PATH.", file=sys.stderr)
+        elif args.subtitles is not False:
+            from btstrm.subtitles import SubtitleFetcher
+
+            ipc_socket = None
+            if "mpv" in player[0]:
+                ipc_dir = tempfile.mkdtemp(prefix="btstrm-mpv-")
+                ipc_socket = os.path.join(ipc_dir, "socket")
+                player_with_options.append(f"--input-ipc-server={ipc_socket}")
+            subtitles = SubtitleFetcher(
+                file_paths,
+                args.subtitles,
+                ipc_socket=ipc_socket,
+                workers=int(config.SUBTITLE_WORKERS),
+            ).start()
+        data_paths = dict(zip(media, file_paths))
+
+        prebuffer_mb = (
+            args.prebuffer if args.prebuffer is not None else float(config.PREBUFFER_MB)
+        )
+        use_prebuffer = prebuffer_mb > 0 or float(config.PREBUFFER_SECONDS) > 0
 
         if len(media) == 1:
+            target = local_copies.get(os.path.relpath(media[0], mountpoint), media[0])
+            if use_prebuffer and target == media[0]:
+                prebuffer(media[0], prebuffer_mb, mountpoint)
+            if subtitles:
+                subtitles.playing = data_paths[media[0]]
             print(f"Playing: {os.path.basename(media[0])}")
-            status = subprocess.call(player_with_options + media, stdin=sys.stdin)
+            status = subprocess.call(
+                player_with_options
+                + subtitle_options(
+                    player, data_paths[media[0]], subtitles, data_dir + "/files"
+                )
+                + [target],
+                stdin=sys.stdin,
+            )
         elif len(media) > 1:
             while media:
-                selection_list = "\n".join(
-                    f"{index}: {os.path.basename(path)}"
-                    for index, path in enumerate(media)
-                )
-                process = subprocess.Popen(
-                    ["fzf", "--with-nth", "2.."],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                )
-                selected, _ = process.communicate(input=selection_list.encode("utf-8"))
-                if process.returncode == 0:
-                    selected_index = int(selected.decode("utf-8").split(":")[0])
+                if selected_index is None:
+                    selected_index = pick_media(media, sizes)
+                if selected_index is not None:
                     selected_file = media[selected_index]
+                    target = local_copies.get(
+                        os.path.relpath(selected_file, mountpoint), selected_file
+                    )
 
+                    # Also stops warming up this file if it was the prefetched one.
+                    prefetch_next(media, selected_file, local_copies, mountpoint)
+                    if use_prebuffer and target == selected_file:
+                        prebuffer(selected_file, prebuffer_mb, mountpoint)
+                    if subtitles:
+                        subtitles.playing = data_paths[selected_file]
                     print(f"Playing: {os.path.basename(selected_file)}")
                     status = subprocess.call(
-                        player_with_options + [selected_file], stdin=sys.stdin
+                        player_with_options
+                        + subtitle_options(
+                            player,
+                            data_paths[selected_file],
+                            subtitles,
+                            data_dir + "/files",
+                        )
+                        + [target],
+                        stdin=sys.stdin,
                     )
 
-                    if REMOVE_PLAYED_FROM_LIST:
+                    if config_bool(config.REMOVE_PLAYED_FROM_LIST):
                         media.pop(selected_index)
+                    selected_index = None
                 else:
                     print("Exiting.")
                     break
@@ -651,7 +683,15 @@ def main():
             status = 3
 
         if media and status == 0 and args.impd:
-            completed_files = scan(mountpoint)
+            if completion:
+                monitor.stop()
+                follower.poll()
+                completed_files = [
+                    os.path.join(mountpoint, path)
+                    for path in completion.completed_files()
+                ]
+            else:
+                completed_files = scan(mountpoint)
             if completed_files:
                 add_to_playlist(completed_files)
             else:
@@ -665,8 +705,28 @@ def main():
         status = 2
 
     finally:
-        subprocess.call(["fusermount", "-z", "-u", mountpoint])
-
+        if active_prebuffer:
+            active_prebuffer.stop()
+        if next_prefetch:
+            next_prefetch.stop()
+        if monitor:
+            monitor.stop()
+        if subtitles:
+            subtitles.stop()
+        if ipc_dir:
+            shutil.rmtree(ipc_dir, ignore_errors=True)
+        if lease:
+            lease.close()
+        elif not local:
+            subprocess.call(["fusermount", "-z", "-u", mountpoint])
+
+    # A --keep mount of btstrmd stays up, what it has so far is indexed now
+    # and again after later sessions.
+    if args.keep and infohash and data_dir and not local:
+        downloads.record(infohash, data_dir, torrent_media)
+
+    if lease or local:
+        sys.exit(status)
     exit(mountpoint, status)
 
 
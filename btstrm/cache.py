@@ -0,0 +1,106 @@
+"""
+Small persistent cache for JSON-serializable values under ~/.cache/btstrm.
+
+Every entry lives in its own file named after a hash of its key. Writes go
+to a temporary file that is renamed into place, so a crash or a concurrent
+btstrm process never observes a half-written entry. The file mtime records
+the last access and is used for LRU eviction once the directory grows past
+its size cap; the creation time stored inside the entry is used for the TTL.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+
+def write_json_atomic(path, data):
+    """Write data as JSON to a temporary file and rename it over path."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def evict_lru(directory, max_bytes, suffix=""):
+    """
+    Remove the least recently used files ending in suffix from directory
+    until their total size fits into max_bytes.
+    """
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+class DiskCache:
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        # Imported here, hashlib's OpenSSL bindings are slow to load.
+        import hashlib
+
+        digest = hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".json")
+
+    def get(self, key, ttl=None):
+        """Return the cached value for key, or None if missing or older than the TTL."""
+        ttl = self.ttl if ttl is None else ttl
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("key") != key or time.time() - entry.get("time", 0) > ttl:
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def set(self, key, value):
+        entry = {"key": key, "time": time.time(), "value": value}
+        write_json_atomic(self._path(key), entry)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes."""
+        evict_lru(self.directory, self.max_bytes, ".json")
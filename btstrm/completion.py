@@ -0,0 +1,127 @@
+"""
+Which files of a torrent are fully downloaded, derived from piece events.
+
+The torrent's file and piece layout maps every finished piece from the
+btfs log onto the files it overlaps, so completion is kept up to date in
+memory instead of being rediscovered by stat()ing every file through the
+FUSE mount.
+"""
+
+import bisect
+import os
+
+from btstrm.bencode import decode_file
+from btstrm.btfs_log import PieceFinished
+
+
+class TorrentLayout:
+    """Files (in torrent order) and piece size of a v1 torrent."""
+
+    def __init__(self, files, piece_length):
+        # files: list of (relative path, length, is_padding)
+        self.files = files
+        self.piece_length = piece_length
+        self.offsets = []
+        offset = 0
+        for _, length, _ in files:
+            self.offsets.append(offset)
+            offset += length
+        self.total_size = offset
+        self.num_pieces = -(-offset // piece_length) if piece_length else 0
+
+    @classmethod
+    def from_metainfo(cls, meta):
+        """Layout of decoded .torrent data, or None if it is not a v1 torrent."""
+        info = meta.get(b"info", meta)
+        name = info.get(b"name.utf-8", info.get(b"name", b"")).decode(
+            "utf-8", errors="replace"
+        )
+        piece_length = info.get(b"piece length")
+        if not piece_length:
+            return None
+
+        if b"files" not in info:
+            if b"length" not in info:
+                return None
+            return cls([(name, info[b"length"], False)], piece_length)
+
+        files = []
+        for entry in info[b"files"]:
+            parts = entry.get(b"path.utf-8", entry.get(b"path", []))
+            path = os.path.join(
+                name, *(part.decode("utf-8", errors="replace") for part in parts)
+            )
+            files.append((path, entry[b"length"], b"p" in entry.get(b"attr", b"")))
+        return cls(files, piece_length)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls.from_metainfo(decode_file(path))
+
+    def piece_range(self, index):
+        """Indices of the files overlapping piece index."""
+        start = index * self.piece_length
+        end = start + self.piece_length
+        first = bisect.bisect_right(self.offsets, start) - 1
+        last = bisect.bisect_left(self.offsets, end) - 1
+        return range(max(first, 0), last + 1)
+
+    def byte_pieces(self, path, start, end):
+        """Indices of the pieces holding bytes start to end of file path."""
+        for (name, length, _), offset in zip(self.files, self.offsets):
+            if name == path:
+                end = min(end, length)
+                if start >= end:
+                    break
+                first = (offset + start) // self.piece_length
+                last = (offset + end - 1) // self.piece_length
+                return range(first, last + 1)
+        return range(0)
+
+
+class CompletionTracker:
+    def __init__(self, layout):
+        self.layout = layout
+        self.finished = bytearray(layout.num_pieces)
+        self.missing = []
+        self.completed = set()
+        for i, (path, length, padding) in enumerate(layout.files):
+            if length == 0:
+                self.missing.append(0)
+                if not padding:
+                    self.completed.add(path)
+                continue
+            first = layout.offsets[i] // layout.piece_length
+            last = (layout.offsets[i] + length - 1) // layout.piece_length
+            self.missing.append(last - first + 1)
+
+    def piece_finished(self, index):
+        if index is None or not 0 <= index < len(self.finished):
+            return
+        if self.finished[index]:
+            return
+        self.finished[index] = 1
+        for i in self.layout.piece_range(index):
+            path, length, padding = self.layout.files[i]
+            if length == 0:
+                continue
+            self.missing[i] -= 1
+            if self.missing[i] == 0 and not padding:
+                self.completed.add(path)
+
+    def count_finished(self, pieces):
+        """How many of the piece indices in pieces have finished."""
+        return sum(self.finished[i] for i in pieces if 0 <= i < len(self.finished))
+
+    def apply(self, event):
+        """LogFollower listener: feeds PieceFinished events to the tracker."""
+        if type(event) is PieceFinished:
+            self.piece_finished(event.index)
+
+    @property
+    def total_files(self):
+        return sum(1 for _, _, padding in self.layout.files if not padding)
+
+    def completed_files(self):
+        """Relative paths of complete files, in torrent order."""
+        return [path for path, _, _ in self.layout.files if path in self.completed]
@@ -0,0 +1,106 @@
+"""
+btstrm settings from ~/.config/btstrm.conf.
+
+The file is only read the first time a setting is accessed as an attribute
+of this module (e.g. `config.JACKETT_URL`), so code paths that need no
+settings never touch the disk.
+"""
+
+import configparser
+import os
+
+home_dir = os.path.expanduser("~")
+cache_dir = os.path.join(home_dir, ".cache", "btstrm")
+daemon_socket = os.path.join(cache_dir, "btstrmd.sock")
+
+_settings = None
+
+
+class CaseSensitiveConfigParser(configparser.ConfigParser):
+    def optionxform(self, optionstr):
+        return optionstr
+
+
+def load_config():
+    """Read ~/.config/btstrm.conf, creating it with the defaults if missing."""
+    default_config = {
+        "LANG": "es-ES",
+        "JACKETT_API_KEY": "",
+        "JACKETT_URL": "http://127.0.0.1:9117",
+        "TMDB_URL": "https://www.themoviedb.org",
+        "TIMEOUT": "30",
+        "REMOVE_PLAYED_FROM_LIST": "False",
+        "STATUS_INTERVAL": "2",
+        "SEARCH_CACHE_TTL": "3600",
+        "SEARCH_CACHE_MAX_MB": "50",
+        "INDEXER_CACHE_TTL": "86400",
+        "JACKETT_AGGREGATE": "False",
+        "STREAM_RESULTS": "False",
+        "SORT_BY": "seeds",
+        "SEARCH_DEADLINE": "20",
+        "SEARCH_CONCURRENCY": "20",
+        "SEARCH_STOP_AFTER": "0",
+        "SEARCH_MIN_SEEDS": "10",
+        "MOUNT_TIMEOUT": "300",
+        "PREBUFFER_MB": "0",
+        "PREBUFFER_SECONDS": "0",
+        "PREBUFFER_TAIL_MB": "4",
+        "PREBUFFER_TIMEOUT": "60",
+        "PREFETCH_NEXT_MB": "32",
+        "PREFETCH_NEXT_KBPS": "1024",
+        "PREFETCH_NEXT_DELAY": "30",
+        "POSTER_CACHE_MAX_MB": "20",
+        "TMDB_CACHE_TTL": "604800",
+        "SUBTITLE_WORKERS": "4",
+        "DAEMON_IDLE_TIMEOUT": "1800",
+        "DOWNLOAD_CACHE_MAX_GB": "20",
+        "RESOLVE_AHEAD": "3",
+        "LINK_CACHE_TTL": "604800",
+    }
+
+    # Keys missing from an older config file fall back to these defaults.
+    settings = dict(default_config)
+
+    config = CaseSensitiveConfigParser()
+
+    config_dir = os.path.join(os.path.expanduser("~"), ".config")
+
+    if not os.path.exists(config_dir):
+        os.makedirs(config_dir)
+
+    config_path = os.path.join(config_dir, "btstrm.conf")
+
+    if not os.path.exists(config_path):
+        print("Config file not found, creating one with default values...")
+
+        config["DEFAULT"] = default_config
+
+        with open(config_path, "w") as f:
+            config.write(f)
+
+    else:
+
+        try:
+            config.read(config_path)
+            for key in default_config.keys():
+                if key in config["DEFAULT"]:
+                    settings[key] = str(config.get("DEFAULT", key))
+
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+
+    return settings
+
+
+def config_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def __getattr__(name):
+    global _settings
+    if name.isupper():
+        if _settings is None:
+            _settings = load_config()
+        if name in _settings:
+            return _settings[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
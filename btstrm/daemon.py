@@ -0,0 +1,302 @@
+"""
+btstrmd: a long-running process that keeps btfs mounts and search state warm.
+
+The daemon listens on a Unix socket (btstrmd.sock in ~/.cache/btstrm) and
+answers one JSON request per connection, one JSON reply per line:
+
+    {"op": "ping"}
+    {"op": "search", "query": ..., "refresh": ..., "aggregate": ..., "sort_by": ...}
+    {"op": "mount", "uri": ..., "keep": ...}
+    {"op": "shutdown"}
+
+A mount reply carries the mountpoint and btfs' data directory. The client
+keeps that connection open while it plays; once it closes, the mount stays
+up (with its peers and downloaded pieces) for DAEMON_IDLE_TIMEOUT seconds,
+so playing the same torrent again, or another episode of it, reuses it
+instead of starting btfs from scratch. Searches run in the daemon, so the
+HTTP connection pool, the indexer list and the imported modules are warm.
+
+When the socket does not answer, btstrm does all of this itself as before.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from btstrm import config
+from btstrm.mount import is_mounted, list_dirs, start_btfs, wait_until_ready
+from btstrm.results import infohash_from_magnet, torrent_infohash
+
+REAP_INTERVAL = 30
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+def socket_path():
+    return config.daemon_socket
+
+
+def connect(timeout=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path())
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def send_request(sock, op, **params):
+    """Send a request over sock and return the reply, raising DaemonError on errors."""
+    sock.sendall(json.dumps(dict(params, op=op)).encode("utf-8") + b"\n")
+    line = sock.makefile("rb").readline()
+    if not line:
+        raise DaemonError("btstrmd closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise DaemonError(reply.get("error", "unknown error"))
+    return reply
+
+
+def request(op, timeout=None, **params):
+    with connect(timeout) as sock:
+        return send_request(sock, op, **params)
+
+
+def available():
+    """Whether a btstrmd is listening on socket_path()."""
+    if not os.path.exists(socket_path()):
+        return False
+    try:
+        request("ping", timeout=1)
+        return True
+    except (OSError, ValueError, DaemonError):
+        return False
+
+
+def mount_key(uri):
+    """Identity of the torrent behind uri, so the same one is mounted once."""
+    if os.path.isfile(uri):
+        with open(uri, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    return infohash_from_magnet(uri) or uri
+
+
+def unmount(mountpoint):
+    try:
+        subprocess.call(
+            ["fusermount", "-z", "-u", mountpoint], stderr=subprocess.DEVNULL
+        )
+    except OSError as e:
+        print(f"Could not unmount {mountpoint}: {e}")
+    try:
+        # Only removes the mountpoint once it is really unmounted and empty.
+        os.rmdir(mountpoint)
+    except OSError:
+        pass
+
+
+class Mount:
+    def __init__(self, uri, keep):
+        self.uri = uri
+        self.keep = keep
+        self.mountpoint = None
+        self.data_dir = None
+        self.error = None
+        self.ready = threading.Event()
+        self.users = 0
+        self.last_used = time.monotonic()
+
+    def start(self):
+        ddir = os.path.join(config.cache_dir, "download")
+        os.makedirs(ddir, exist_ok=True)
+        self.mountpoint = tempfile.mkdtemp(prefix="btstrm-", dir=config.cache_dir)
+        try:
+            before = list_dirs(ddir)
+            failed = start_btfs(self.uri, self.mountpoint, ddir, self.keep)
+            if failed:
+                raise DaemonError(f"btfs exited with status {failed}")
+            self.data_dir = wait_until_ready(
+                self.mountpoint,
+                ddir,
+                before,
+                timeout=float(config.MOUNT_TIMEOUT),
+                infohash=torrent_infohash(self.uri),
+            )
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            unmount(self.mountpoint)
+        finally:
+            self.ready.set()
+
+    @property
+    def alive(self):
+        return self.error is None and is_mounted(self.mountpoint)
+
+
+class Daemon:
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self.mounts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, uri, keep=False):
+        # btfs deletes the data of a mount without --keep when it goes away,
+        # so sessions that keep and sessions that do not never share one.
+        key = (mount_key(uri), bool(keep))
+        with self.lock:
+            mount = self.mounts.get(key)
+            if mount and mount.ready.is_set() and not mount.alive:
+                mount = None
+            starting = mount is None
+            if starting:
+                mount = self.mounts[key] = Mount(uri, keep)
+            mount.users += 1
+
+        if starting:
+            print(f"Mounting {uri}")
+            mount.start()
+        else:
+            mount.ready.wait()
+
+        if mount.error:
+            with self.lock:
+                mount.users -= 1
+                if self.mounts.get(key) is mount:
+                    del self.mounts[key]
+            raise DaemonError(mount.error)
+        return mount
+
+    def release(self, mount):
+        with self.lock:
+            mount.users -= 1
+            mount.last_used = time.monotonic()
+
+    def reap(self, everything=False):
+        """Unmount torrents nobody played for idle_timeout seconds."""
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                (key, mount)
+                for key, mount in self.mounts.items()
+                if mount.ready.is_set()
+                and (
+                    everything
+                    or not mount.alive
+                    or (mount.users == 0 and now - mount.last_used > self.idle_timeout)
+                )
+            ]
+            for key, _ in idle:
+                del self.mounts[key]
+        for _, mount in idle:
+            print(f"Unmounting {mount.uri}")
+            unmount(mount.mountpoint)
+
+    def reap_forever(self):
+        while True:
+            time.sleep(REAP_INTERVAL)
+            self.reap()
+
+    def search(self, query, refresh=False, aggregate=False, sort_by="seeds"):
+        from btstrm.jackett import search_all
+
+        store = search_all(query, refresh, aggregate, progress=False)
+        return [t.to_dict() for t in store.ranked(sort_by)]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def reply(self, **data):
+        self.wfile.write(json.dumps(dict(data, ok=True)).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            req = json.loads(self.rfile.readline())
+            op = req.pop("op", None)
+            if op == "ping":
+                self.reply()
+            elif op == "search":
+                self.reply(results=daemon.search(**req))
+            elif op == "mount":
+                mount = daemon.acquire(req["uri"], req.get("keep", False))
+                try:
+                    self.reply(mountpoint=mount.mountpoint, data_dir=mount.data_dir)
+                    # The mount is in use until the client hangs up.
+                    self.rfile.read()
+                finally:
+                    daemon.release(mount)
+            elif op == "shutdown":
+                self.reply()
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                raise DaemonError(f"unknown request {op!r}")
+        except Exception as e:
+            try:
+                error = json.dumps({"ok": False, "error": str(e) or repr(e)})
+                self.wfile.write(error.encode("utf-8") + b"\n")
+            except OSError:
+                pass
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="btstrmd", description="keep btstrm's mounts and searches warm"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="unmount torrents not played for this long (default: DAEMON_IDLE_TIMEOUT)",
+    )
+    args = parser.parse_args()
+
+    path = socket_path()
+    if available():
+        print(f"btstrmd is already listening on {path}", file=sys.stderr)
+        sys.exit(1)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+
+    idle_timeout = args.idle_timeout
+    if idle_timeout is None:
+        idle_timeout = float(config.DAEMON_IDLE_TIMEOUT)
+    daemon = Daemon(idle_timeout)
+    server = Server(path, RequestHandler)
+    server.daemon = daemon
+    threading.Thread(target=daemon.reap_forever, daemon=True).start()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"btstrmd listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+        daemon.reap(everything=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Index of the torrents kept with --keep, by infohash.
+
+btfs downloads every session into a new directory under
+~/.cache/btstrm/download and has no way to resume into an existing one,
+so a kept directory cannot be handed back to btfs. Instead,
+~/.cache/btstrm/downloads.json records which directories hold which
+torrent and, for each of its files that is complete on disk, the directory
+it is complete in. Those files are played straight from the disk, without
+mounting anything, and btfs is only started when a file that is not
+complete is wanted. A torrent gains a directory every time such a session
+is kept, e.g. when later episodes of a season are watched.
+
+btfs only writes the files that were read, so the videos of the torrent
+are recorded separately from what is on disk, while the mount lists them
+all. A magnet link has no other source for them before it is mounted.
+
+The index is capped at DOWNLOAD_CACHE_MAX_GB. The directories of the
+torrents played least recently are deleted first; nothing else deletes
+kept data.
+"""
+
+import json
+import os
+import shutil
+import time
+
+from btstrm import config
+from btstrm.cache import write_json_atomic
+
+index_path = os.path.join(config.cache_dir, "downloads.json")
+
+
+def upgrade_entry(entry):
+    """Entry of the index format with a single data directory per torrent."""
+    if "data_dir" not in entry:
+        return entry
+    data_dir = entry["data_dir"]
+    return {
+        "dirs": [data_dir],
+        "files": entry["files"],
+        "complete": {relpath: data_dir for relpath in entry["complete"]},
+        "bytes": entry["bytes"],
+        "last_used": entry["last_used"],
+    }
+
+
+def load_index():
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {infohash: upgrade_entry(entry) for infohash, entry in index.items()}
+
+
+def walk_files(files_dir):
+    """(relative path, os.stat result) of every file below files_dir."""
+    for dirpath, _, names in os.walk(files_dir):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield os.path.relpath(path, files_dir), st
+
+
+def scan_files(files_dir):
+    """
+    Sizes of all files below files_dir, the complete ones among them and the
+    bytes they occupy. btfs writes sparse files, so a file is complete when
+    all of its blocks are allocated.
+    """
+    files = {}
+    complete = []
+    used = 0
+    for relpath, st in walk_files(files_dir):
+        files[relpath] = st.st_size
+        used += st.st_blocks * 512
+        if st.st_size > 0 and st.st_blocks * 512 >= st.st_size:
+            complete.append(relpath)
+    return files, sorted(complete), used
+
+
+def remove(entry):
+    for data_dir in entry["dirs"]:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def local_copies(entry):
+    """Path on disk of every complete file of entry, by relative path."""
+    return {
+        relpath: os.path.join(data_dir, "files", relpath)
+        for relpath, data_dir in entry["complete"].items()
+    }
+
+
+def lookup(infohash):
+    """The index entry of a kept torrent, or None if nothing of it is on disk."""
+    index = load_index()
+    entry = index.get(infohash)
+    if not entry:
+        return None
+    entry["dirs"] = [
+        data_dir
+        for data_dir in entry["dirs"]
+        if os.path.isdir(os.path.join(data_dir, "files"))
+    ]
+    if not entry["dirs"]:
+        del index[infohash]
+        write_json_atomic(index_path, index)
+        return None
+    entry["complete"] = {
+        relpath: data_dir
+        for relpath, data_dir in entry["complete"].items()
+        if data_dir in entry["dirs"]
+        and os.path.exists(os.path.join(data_dir, "files", relpath))
+    }
+    entry["last_used"] = time.time()
+    write_json_atomic(index_path, index)
+    return entry
+
+
+def record(infohash, data_dir, media=None):
+    """
+    Add the btfs data directory of a finished --keep session to the index.
+    If the torrent was already kept, the directory joins its earlier ones
+    and every file is taken from the first directory it is complete in.
+    media maps the relative path of every video in the torrent to its size.
+    """
+    index = load_index()
+    previous = index.get(infohash) or {}
+    dirs = list(previous.get("dirs", []))
+    if data_dir not in dirs:
+        dirs.append(data_dir)
+
+    entry = {"dirs": [], "files": {}, "complete": {}, "bytes": 0}
+    media = media or previous.get("media")
+    if media:
+        entry["media"] = media
+    for directory in dirs:
+        files_dir = os.path.join(directory, "files")
+        if not os.path.isdir(files_dir):
+            continue
+        files, complete, used = scan_files(files_dir)
+        entry["dirs"].append(directory)
+        entry["files"].update(files)
+        for relpath in complete:
+            entry["complete"].setdefault(relpath, directory)
+        entry["bytes"] += used
+    if not entry["dirs"]:
+        return None
+    entry["last_used"] = time.time()
+    index[infohash] = entry
+
+    evict(index, float(config.DOWNLOAD_CACHE_MAX_GB) * 1024**3, keep=infohash)
+    write_json_atomic(index_path, index)
+    return entry
+
+
+def evict(index, max_bytes, keep=None):
+    """Delete least recently played torrents until index fits into max_bytes."""
+    total = sum(entry["bytes"] for entry in index.values())
+    by_age = sorted(index.items(), key=lambda item: item[1]["last_used"])
+    for infohash, entry in by_age:
+        if total <= max_bytes:
+            break
+        if infohash == keep:
+            continue
+        remove(entry)
+        del index[infohash]
+        total -= entry["bytes"]
@@ -0,0 +1,471 @@
+"""
+Torrent search through Jackett's torznab API.
+
+Indexers are searched from an asyncio event loop: every query variant of
+every indexer is a task, the blocking requests run on a bounded thread
+pool, and the whole search stops at a global deadline, or earlier once
+enough well-seeded results came in. Requests still running at that point
+stop reading their responses and their results are dropped.
+"""
+
+import asyncio
+import functools
+import hashlib
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from tqdm import tqdm
+from unidecode import unidecode
+
+from btstrm import config, net
+from btstrm.cache import DiskCache
+from btstrm.results import ResultStore, Torrent, infohash_from_magnet
+from btstrm.stats import IndexerStats
+
+# Bumped whenever the cached result format changes.
+RESULTS_FORMAT = 2
+search_cache = DiskCache(
+    os.path.join(config.cache_dir, "search"),
+    ttl=int(config.SEARCH_CACHE_TTL),
+    max_bytes=int(float(config.SEARCH_CACHE_MAX_MB) * 1024 * 1024),
+)
+indexer_stats = IndexerStats(os.path.join(config.cache_dir, "indexer-stats.json"))
+indexer_cache = DiskCache(
+    os.path.join(config.cache_dir, "indexers"),
+    ttl=int(config.INDEXER_CACHE_TTL),
+    max_bytes=1024 * 1024,
+)
+
+
+def fetch_jackett_indexers():
+    response = net.get(
+        f"{config.JACKETT_URL}/api/v2.0/indexers/all/results/torznab/api?apikey={config.JACKETT_API_KEY}&t=indexers&configured=true"
+    )
+    response.raise_for_status()
+    xml_response = ET.fromstring(response.content)
+    return [indexer.get("id") for indexer in xml_response.findall(".//indexer")]
+
+
+def indexers_cache_key():
+    # Changing the Jackett instance or API key invalidates the cached list.
+    api_key_hash = hashlib.sha1(config.JACKETT_API_KEY.encode("utf-8")).hexdigest()
+    return [config.JACKETT_URL, api_key_hash]
+
+
+def revalidate_indexers(key):
+    try:
+        indexer_cache.set(key, fetch_jackett_indexers())
+    except net.NETWORK_ERRORS + (ET.ParseError,):
+        pass
+
+
+def get_jackett_indexers(refresh=False):
+    key = indexers_cache_key()
+    if not refresh:
+        indexers = indexer_cache.get(key)
+        if indexers is not None:
+            # Start searching with the cached list and refresh it for next time.
+            threading.Thread(
+                target=revalidate_indexers, args=(key,), daemon=True
+            ).start()
+            return indexers
+
+    try:
+        indexers = fetch_jackett_indexers()
+    except net.NETWORK_ERRORS + (ET.ParseError,) as e:
+        print(f"Error retrieving indexers: {e}")
+        return []
+
+    indexer_cache.set(key, indexers)
+    return indexers
+
+
+def parse_torznab_item(item, indexer):
+    fields = {}
+    attrs = {}
+    # One pass over the children instead of a find() per field.
+    for child in item:
+        name = child.get("name")
+        if name is not None and child.get("value") is not None:
+            attrs[name] = child.get("value")
+        else:
+            fields[child.tag] = child
+
+    title = fields["title"].text if "title" in fields else "No Title"
+    link = fields["link"].text if "link" in fields else "No Link"
+    seeds = int(attrs.get("seeders", "0"))
+    # torznab "peers" counts seeders and leechers together.
+    leechers = max(0, int(attrs.get("peers", seeds)) - seeds)
+    size = int(fields["size"].text) if "size" in fields else 0
+    # Results of the aggregate "all" indexer name their source tracker.
+    tracker = (
+        fields["jackettindexer"].get("id") if "jackettindexer" in fields else indexer
+    )
+    infohash = attrs.get("infohash") or infohash_from_magnet(attrs.get("magneturl"))
+    return Torrent(title, tracker, size, seeds, leechers, link, infohash)
+
+
+def iter_torznab_items(stream, indexer):
+    """
+    Parse a torznab response incrementally and yield a result per <item>
+    as soon as its closing tag has been read. Finished items are removed
+    from the tree so memory stays flat for huge responses.
+    """
+    parents = []
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == "item":
+            yield parse_torznab_item(elem, indexer)
+            if parents:
+                parents[-1].remove(elem)
+
+
+def search_torrents(query, indexer, on_result=None, stop=None, record=None):
+    """
+    Search one indexer. Every result is passed to on_result as soon as it is
+    parsed. Returns the list of results, or None if the request failed or
+    the stop event was set before it finished. The outcome goes to record,
+    indexer_stats.record by default.
+    """
+    record = record or indexer_stats.record
+    torrents = []
+    if stop is not None and stop.is_set():
+        return None
+    started = time.monotonic()
+    try:
+        with net.get(
+            f"{config.JACKETT_URL}/api/v2.0/indexers/{indexer}/results/torznab/api?apikey={config.JACKETT_API_KEY}&q={query}",
+            timeout=indexer_stats.timeout_for(indexer, float(config.TIMEOUT)),
+            stream=True,
+            stop=stop,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            for torrent in iter_torznab_items(response.raw, indexer):
+                if stop is not None and stop.is_set():
+                    return None
+                torrents.append(torrent)
+                if on_result:
+                    on_result(torrent)
+
+    except net.NETWORK_ERRORS + (ET.ParseError, ValueError) as e:
+        if stop is not None and stop.is_set():
+            return None
+        record(indexer, time.monotonic() - started, False, 0)
+        print(f"Error searching torrents for indexer {indexer}: {e}")
+        return None
+
+    if stop is not None and stop.is_set():
+        return None
+    record(indexer, time.monotonic() - started, True, len(torrents))
+    return torrents
+
+
+NON_ASCII_LETTERS = (
+    "á",
+    "é",
+    "í",
+    "ó",
+    "ú",
+    "ü",
+    "ñ",
+    "ç",
+    "à",
+    "è",
+    "ì",
+    "ò",
+    "ù",
+    "â",
+    "ê",
+    "î",
+    "ô",
+    "û",
+    "ä",
+    "ë",
+    "ï",
+    "ö",
+    "ü",
+    "ÿ",
+    "ø",
+    "å",
+    "æ",
+    "œ",
+    "ß",
+    "ð",
+    "þ",
+    "ł",
+    "ž",
+    "š",
+    "ý",
+)
+
+
+def normalize_query(query):
+    ascii_query = unidecode(query)
+    return ascii_query
+
+
+def cache_key(query, indexer):
+    return [" ".join(query.lower().split()), indexer, RESULTS_FORMAT]
+
+
+def query_variants(query):
+    """The query, plus its ASCII transliteration if it has accented letters."""
+    if any(letter in query for letter in NON_ASCII_LETTERS):
+        return [query, normalize_query(query)]
+    return [query]
+
+
+def run_in_daemon_thread(loop, call):
+    """
+    Like loop.run_in_executor(), but in a daemon thread: a request still
+    hanging when the search is cut short must not delay asyncio.run() or
+    the exit of the process.
+    """
+    future = loop.create_future()
+
+    def resolve(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        result, error = None, None
+        try:
+            result = call()
+        except Exception as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(resolve, result, error)
+        except RuntimeError:
+            # The event loop is already closed.
+            pass
+
+    threading.Thread(target=target, name="btstrm-search", daemon=True).start()
+    return future
+
+
+async def search_indexer(query, indexer, refresh, run, stop, record):
+    key = cache_key(query, indexer)
+    if not refresh:
+        cached = search_cache.get(key)
+        if cached is not None:
+            return [Torrent.from_dict(t) for t in cached]
+
+    # Both spellings are searched at the same time.
+    responses = await asyncio.gather(
+        *(
+            run(
+                indexer,
+                functools.partial(
+                    search_torrents, variant, indexer, stop=stop, record=record
+                ),
+            )
+            for variant in query_variants(query)
+        )
+    )
+
+    if all(response is None for response in responses):
+        return None
+
+    store = ResultStore()
+    for response in responses:
+        store.extend(response or [])
+    torrents_unique = store.torrents
+
+    # Failed requests are not cached so the next search retries the indexer.
+    if None not in responses:
+        search_cache.set(key, [t.to_dict() for t in torrents_unique])
+    return torrents_unique
+
+
+def enough_results(store):
+    """Whether SEARCH_STOP_AFTER results with SEARCH_MIN_SEEDS seeders arrived."""
+    wanted = int(config.SEARCH_STOP_AFTER)
+    if wanted <= 0:
+        return False
+    min_seeds = int(config.SEARCH_MIN_SEEDS)
+    return sum(1 for t in store.torrents if t.seeds >= min_seeds) >= wanted
+
+
+CANCEL_POLL_INTERVAL = 0.1
+
+
+async def wait_for_event(event):
+    while not event.is_set():
+        await asyncio.sleep(CANCEL_POLL_INTERVAL)
+
+
+async def search_concurrently(
+    query, indexers, refresh=False, on_results=None, pbar=None, cancel=None
+):
+    """
+    Search indexers concurrently until all of them answered, enough results
+    came in or SEARCH_DEADLINE expired. Returns the ResultStore and the
+    number of indexers that answered. Indexers still searching at the
+    deadline are recorded as failed, so slow ones build up a history like
+    any other. When enough results came in or the cancel event was set, they
+    were not too slow, the search just did not need them any more.
+    """
+    deadline = float(config.SEARCH_DEADLINE)
+    limiter = asyncio.Semaphore(int(config.SEARCH_CONCURRENCY))
+    stop = threading.Event()
+    loop = asyncio.get_running_loop()
+
+    # When each indexer's first request left, waiting for the limiter
+    # does not count against it.
+    started = {}
+
+    # Outcomes are only recorded until the search ends; after that the
+    # indexers still searching are settled here, each one once.
+    record_lock = threading.Lock()
+    recorded = set()
+
+    def record(indexer, seconds, ok, results):
+        with record_lock:
+            if stop.is_set():
+                return
+            recorded.add(indexer)
+            indexer_stats.record(indexer, seconds, ok, results)
+
+    async def run(indexer, call):
+        async with limiter:
+            started.setdefault(indexer, time.monotonic())
+            return await run_in_daemon_thread(loop, call)
+
+    store = ResultStore()
+    answered = finished = 0
+    tasks = {
+        asyncio.ensure_future(
+            search_indexer(query, indexer, refresh, run, stop, record)
+        ): indexer
+        for indexer in indexers
+    }
+    if not tasks:
+        return store, answered
+    # The picker closing ends the search like the deadline does, except
+    # that the indexers still searching are not to blame.
+    cancelled = asyncio.ensure_future(wait_for_event(cancel or stop))
+    timed_out = False
+    try:
+        for next_done in asyncio.as_completed(
+            list(tasks) + [cancelled], timeout=deadline or None
+        ):
+            torrents = await next_done
+            if cancelled.done():
+                break
+            if torrents is not None:
+                answered += 1
+            store.extend(torrents or [])
+            if torrents and on_results:
+                on_results(torrents)
+            if pbar is not None:
+                pbar.update()
+            finished += 1
+            if finished == len(tasks) or enough_results(store):
+                break
+    except asyncio.TimeoutError:
+        timed_out = True
+        waiting = sum(1 for task in tasks if not task.done())
+        print(f"Search deadline of {deadline:g}s reached, skipped {waiting} indexers.")
+    finally:
+        with record_lock:
+            stop.set()
+            now = time.monotonic()
+            for task, indexer in tasks.items():
+                if (
+                    timed_out
+                    and not task.done()
+                    and indexer in started
+                    and indexer not in recorded
+                ):
+                    indexer_stats.record(indexer, now - started[indexer], False, 0)
+        net.abandon(stop)
+        cancelled.cancel()
+        for task in tasks:
+            task.cancel()
+
+    return store, answered
+
+
+def search_indexers(query, refresh=False, on_results=None, progress=True, cancel=None):
+    # Fastest indexers get a worker first; chronically failing ones are
+    # skipped for a while unless the user asked to query everything again.
+    indexers, dead = indexer_stats.order(get_jackett_indexers(refresh))
+    if refresh:
+        indexers += dead
+    elif dead:
+        print(f"Skipping unresponsive indexers: {', '.join(dead)}")
+
+    with tqdm(
+        total=len(indexers),
+        desc="Searching torrents",
+        ncols=70,
+        disable=not progress,
+    ) as pbar:
+        store, _ = asyncio.run(
+            search_concurrently(query, indexers, refresh, on_results, pbar, cancel)
+        )
+
+    return store
+
+
+def search_all(
+    query,
+    refresh=False,
+    aggregate=False,
+    on_results=None,
+    progress=True,
+    cancel=None,
+):
+    """
+    Search Jackett, through the aggregate indexer if requested, otherwise
+    (or if that fails) one indexer at a time. Each batch of results is passed
+    to on_results as soon as it is available. Setting the threading.Event
+    cancel ends the search early. Returns a ResultStore with the results of
+    all indexers merged.
+    """
+    try:
+        if aggregate:
+            store, answered = asyncio.run(
+                search_concurrently(query, ["all"], refresh, on_results, cancel=cancel)
+            )
+            if answered or (cancel is not None and cancel.is_set()):
+                return store
+            print("Aggregate search failed, searching indexers one by one.")
+
+        return search_indexers(query, refresh, on_results, progress, cancel)
+    finally:
+        indexer_stats.save()
+
+
+def print_indexer_stats():
+    indexers = indexer_stats.indexers()
+    if not indexers:
+        print("No indexer statistics recorded yet.")
+        return
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    print(
+        f"{'indexer':<24} {'searches':>8} {'p50':>8} {'p90':>8} {'errors':>7} "
+        f"{'results':>8} {'timeout':>8}"
+    )
+    for indexer in indexers:
+        summary = indexer_stats.summary(indexer)
+        timeout = indexer_stats.timeout_for(indexer, float(config.TIMEOUT))
+        status = "  skipped" if indexer_stats.is_dead(indexer) else ""
+        print(
+            f"{indexer:<24} {summary['searches']:>8} {seconds(summary['p50']):>8} "
+            f"{seconds(summary['p90']):>8} {summary['error_rate']:>7.0%} "
+            f"{summary['results']:>8.1f} {seconds(timeout):>8}{status}"
+        )
@@ -0,0 +1,203 @@
+"""
+Waiting for a btfs mount to become usable.
+
+Instead of polling the mountpoint every 250ms, the FUSE mount is detected
+through POLLPRI notifications on /proc/self/mountinfo, and the torrent
+contents through inotify events on btfs' data directory (btfs appends to
+its log.txt as soon as metadata arrives). The data directory belonging to
+this session is the one btfs created after our snapshot of the download
+directory, so concurrent sessions do not pick up each other's logs.
+"""
+
+import os
+import select
+import subprocess
+import time
+
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Even with notifications, look again at least this often: changes inside
+# the FUSE filesystem itself are not reported by inotify.
+MAX_WAIT = 1.0
+POLL_INTERVAL = 0.25
+
+
+class Watcher:
+    """Sleeps until something changes in the watched directories, or polls."""
+
+    def __init__(self):
+        self.fd = None
+        self.libc = None
+        # ctypes only loads once something is mounted, not on every start.
+        import ctypes
+        import ctypes.util
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd >= 0:
+            self.fd = fd
+            self.libc = libc
+
+    def add(self, path, mask=IN_CREATE | IN_MODIFY | IN_MOVED_TO):
+        if self.fd is not None:
+            self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+    def wait(self, timeout):
+        if self.fd is None:
+            time.sleep(min(timeout, POLL_INTERVAL))
+            return
+        ready, _, _ = select.select([self.fd], [], [], min(timeout, MAX_WAIT))
+        if ready:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _unescape(field):
+    # mountinfo escapes space, tab, newline and backslash as octal.
+    return (
+        field.replace("\\040", " ")
+        .replace("\\011", "\t")
+        .replace("\\012", "\n")
+        .replace("\\134", "\\")
+    )
+
+
+def mount_points(mountinfo_text):
+    return {_unescape(line.split()[4]) for line in mountinfo_text.splitlines()}
+
+
+def is_mounted(mountpoint):
+    """Whether mountpoint is mounted, bind mounts on the same device included."""
+    try:
+        with open("/proc/self/mountinfo", "r") as f:
+            return os.path.realpath(mountpoint) in mount_points(f.read())
+    except OSError:
+        return os.path.ismount(mountpoint)
+
+
+def remaining(deadline):
+    if deadline is None:
+        return MAX_WAIT
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("btfs did not become ready in time")
+    return left
+
+
+def wait_mounted(mountpoint, deadline=None):
+    """Block until mountpoint shows up in /proc/self/mountinfo."""
+    mountpoint = os.path.realpath(mountpoint)
+    try:
+        mountinfo = open("/proc/self/mountinfo", "r")
+    except OSError:
+        while not os.path.ismount(mountpoint):
+            time.sleep(min(remaining(deadline), POLL_INTERVAL))
+        return
+
+    with mountinfo:
+        poller = select.poll()
+        poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+        while True:
+            # Reading the file also re-arms the change notification.
+            mountinfo.seek(0)
+            if mountpoint in mount_points(mountinfo.read()):
+                return
+            poller.poll(remaining(deadline) * 1000)
+
+
+def list_dirs(directory):
+    try:
+        return {
+            name
+            for name in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, name))
+        }
+    except OSError:
+        return set()
+
+
+def _log_mentions(data_dir, infohash):
+    try:
+        with open(os.path.join(data_dir, "log.txt"), "r", errors="replace") as f:
+            return infohash.lower() in f.read(1024 * 1024).lower()
+    except OSError:
+        return False
+
+
+def find_data_dir(ddir, before, mountpoint, infohash=None):
+    """
+    The btfs data directory created since the `before` snapshot of ddir.
+    When several sessions started at once, the one whose log mentions the
+    infohash, or whose files match the torrent mounted at mountpoint, wins.
+    """
+    candidates = [os.path.join(ddir, d) for d in list_dirs(ddir) - before]
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+
+    if infohash:
+        for candidate in candidates:
+            if _log_mentions(candidate, infohash):
+                return candidate
+
+    names = set(os.listdir(mountpoint))
+    for candidate in candidates:
+        try:
+            files = set(os.listdir(os.path.join(candidate, "files")))
+        except OSError:
+            continue
+        if names & files:
+            return candidate
+
+    return max(candidates, key=os.path.getmtime)
+
+
+def start_btfs(uri, mountpoint, ddir, keep=False):
+    """
+    Launch btfs for uri on mountpoint. Returns its exit status; btfs forks
+    into the background once the filesystem is mounted.
+    """
+    command = ["btfs", f"--data-directory={ddir}", uri, mountpoint]
+    if keep:
+        command.insert(1, "--keep")
+    return subprocess.call(command)
+
+
+def wait_until_ready(mountpoint, ddir, before, timeout=None, infohash=None):
+    """
+    Wait for btfs to mount mountpoint and expose the torrent's files, then
+    return its data directory. Raises TimeoutError after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    watcher = Watcher()
+    try:
+        watcher.add(ddir)
+        wait_mounted(mountpoint, deadline)
+
+        watched = set()
+        while not os.listdir(mountpoint):
+            for name in list_dirs(ddir) - before - watched:
+                watcher.add(os.path.join(ddir, name))
+                watched.add(name)
+            watcher.wait(remaining(deadline))
+
+        data_dir = find_data_dir(ddir, before, mountpoint, infohash)
+        if data_dir is None:
+            raise FileNotFoundError(f"btfs created no data directory in {ddir}")
+        return data_dir
+    finally:
+        watcher.close()
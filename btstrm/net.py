@@ -0,0 +1,194 @@
+"""
+One HTTP session shared by every outbound request btstrm makes.
+
+Connections to Jackett, TMDB and the poster CDN are pooled and kept alive,
+so TLS/TCP handshakes happen once per host instead of once per request.
+Connection failures and 5xx responses are retried a bounded number of
+times with jittered exponential backoff, and a per-host semaphore caps how
+many requests run against the same host at once. A streamed response
+holds its slot until it is closed, since its body is downloaded after
+get() returns. Requests made on behalf of a search give their slots back
+as soon as the search abandons them, and no request waits for a slot for
+longer than TIMEOUT.
+"""
+
+import random
+import threading
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from btstrm import config
+
+# Connections kept per host beyond the requests allowed to run against it,
+# so a finished request always has room to return its connection.
+POOL_HEADROOM = 4
+# Hosts whose connection pools are kept (Jackett, TMDB, poster CDN, ...).
+POOL_HOSTS = 10
+RETRIES = 2
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Errors raised while requesting or while reading a streamed response body.
+NETWORK_ERRORS = (requests.exceptions.RequestException, urllib3.exceptions.HTTPError)
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_host_lock = threading.Lock()
+# Slots held by requests made with a stop event, by event.
+_stoppable = {}
+_stoppable_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """Retry whose backoff is spread randomly to avoid synchronized retries."""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.5) if backoff else 0
+
+
+def max_per_host():
+    """Requests allowed against one host at once: all searches of a search."""
+    return max(1, int(config.SEARCH_CONCURRENCY))
+
+
+def _make_session():
+    retry = JitteredRetry(
+        total=RETRIES,
+        connect=RETRIES,
+        # A read timeout already cost the caller its whole timeout, retrying
+        # it would multiply the wait instead of hiding a transient failure.
+        read=0,
+        status=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=max_per_host() + POOL_HEADROOM,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _make_session()
+        return _session
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc
+    with _host_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(max_per_host())
+        return _host_limits[host]
+
+
+class _Slot:
+    """A request's place in the per-host limit, given back exactly once."""
+
+    def __init__(self, limit, stop=None):
+        self.limit = limit
+        self.stop = stop
+        self._lock = threading.Lock()
+        # Past the timeout the request goes ahead without a slot rather than
+        # wait behind requests that are stuck.
+        self.held = limit.acquire(timeout=float(config.TIMEOUT))
+        if self.held and stop is not None:
+            with _stoppable_lock:
+                _stoppable.setdefault(stop, set()).add(self)
+            if stop.is_set():
+                self.release()
+
+    def release(self):
+        with self._lock:
+            if not self.held:
+                return
+            self.held = False
+        if self.stop is not None:
+            with _stoppable_lock:
+                slots = _stoppable.get(self.stop)
+                if slots is not None:
+                    slots.discard(self)
+                    if not slots:
+                        del _stoppable[self.stop]
+        self.limit.release()
+
+
+def abandon(stop):
+    """
+    Give back the slots of the requests made with the stop event, once it is
+    set and their results are no longer wanted. The requests themselves run
+    on until they return or time out.
+    """
+    with _stoppable_lock:
+        slots = _stoppable.pop(stop, ())
+    for slot in list(slots):
+        slot.release()
+
+
+def get(url, stop=None, **kwargs):
+    """
+    requests.get() through the shared session, limited per host. With
+    stream=True the limit is held until the response is closed, so close
+    it, e.g. by using it in a with statement. A request made with a stop
+    event frees its slot early when abandon() is called with it.
+    """
+    slot = _Slot(_host_limit(url), stop)
+    try:
+        response = get_session().get(url, **kwargs)
+    except BaseException:
+        slot.release()
+        raise
+    if not kwargs.get("stream"):
+        slot.release()
+        return response
+
+    close = response.close
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            slot.release()
+
+    response.close = close_and_release
+    return response
+
+
+def connection_stats():
+    """Requests served and connections opened per host, to show connection reuse."""
+    stats = []
+    if _session is None:
+        return stats
+    seen = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats.append(
+                {
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "requests": pool.num_requests,
+                    "connections": pool.num_connections,
+                }
+            )
+    return stats
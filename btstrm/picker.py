@@ -0,0 +1,146 @@
+"""
+fzf pickers for Jackett search results.
+"""
+
+import contextlib
+import io
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+
+from btstrm import config
+from btstrm.jackett import search_all
+from btstrm.resolver import resolve_ahead
+from btstrm.results import ResultStore
+
+
+def format_result(result):
+    return (
+        f"{result.display_title}\t{result.seeds}\t{result.size_human}\t{result.link}\n"
+    )
+
+
+def fzf_results_args():
+    return [
+        "fzf",
+        "--height=20",
+        "--no-sort",
+        "--delimiter",
+        "\t",
+        "--with-nth",
+        "1,2,3",
+        "--preview",
+        'echo {} | awk -F\'\t\' \'{print "\\033[1mName:\\033[0m ", $1, "\\n\\033[1mSeeders:\\033[0m ", $2, "\\n\\033[1mSize:\\033[0m ", $3}\'',
+        "--preview-window",
+        "right:wrap",
+        "-q",
+        "",
+    ]
+
+
+def call_fzf_with_results(results):
+    # The best ranked results are the likely picks; have them ready.
+    resolve_ahead([result.link for result in results[: int(config.RESOLVE_AHEAD)]])
+    with tempfile.NamedTemporaryFile(mode="w+", delete=True) as temp_file:
+        for result in results:
+            temp_file.write(format_result(result))
+        temp_file.flush()
+
+        selected = subprocess.check_output(
+            fzf_results_args(),
+            stdin=open(temp_file.name),
+        )
+
+        return selected.decode("utf-8").split("\t")[-1].strip()
+
+
+def write_ranked_results(path, store, sort_by):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for result in store.ranked(sort_by):
+            f.write(format_result(result))
+    os.replace(tmp_path, path)
+
+
+def stream_results_to_fzf(query, refresh=False, aggregate=False, sort_by="seeds"):
+    """
+    Open fzf right away and feed it each indexer's results as they arrive,
+    so the fastest indexer decides when the first pick is possible. Releases
+    already shown are not repeated. The merged results are kept ranked in a
+    spool file that ctrl-r reloads. Returns the selected link, or None if
+    nothing was selected.
+    """
+    with tempfile.TemporaryDirectory(prefix="btstrm-") as spool_dir:
+        spool = os.path.join(spool_dir, "results")
+        open(spool, "w").close()
+        fzf = subprocess.Popen(
+            fzf_results_args()
+            + [
+                "--header",
+                f"ctrl-r: rank by {sort_by}",
+                "--bind",
+                f"ctrl-r:reload(cat {shlex.quote(spool)})",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        store = ResultStore()
+        lock = threading.Lock()
+        picker_closed = threading.Event()
+
+        def feed(torrents):
+            new_torrents = store.extend(torrents)
+            lines = "".join(
+                format_result(t)
+                for t in sorted(
+                    new_torrents, key=lambda t: getattr(t, sort_by), reverse=True
+                )
+            )
+            with lock:
+                if picker_closed.is_set():
+                    return
+                write_ranked_results(spool, store, sort_by)
+                try:
+                    fzf.stdin.write(lines)
+                    fzf.stdin.flush()
+                except (BrokenPipeError, ValueError):
+                    # fzf already exited, the user made a choice.
+                    pass
+
+        def search():
+            search_all(
+                query,
+                refresh,
+                aggregate,
+                on_results=feed,
+                progress=False,
+                cancel=picker_closed,
+            )
+            # Once a result is chosen the others are not worth resolving.
+            if fzf.poll() is None:
+                ahead = int(config.RESOLVE_AHEAD)
+                resolve_ahead([t.link for t in store.ranked(sort_by)[:ahead]])
+            with lock:
+                if not picker_closed.is_set():
+                    try:
+                        fzf.stdin.close()
+                    except BrokenPipeError:
+                        pass
+
+        # Keep indexer errors from drawing over the picker, show them afterwards.
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(errors):
+            threading.Thread(target=search, daemon=True).start()
+            selected = fzf.stdout.read()
+            fzf.wait()
+            with lock:
+                picker_closed.set()
+        sys.stdout.write(errors.getvalue())
+
+        if fzf.returncode != 0 or not selected.strip():
+            return None
+        return selected.strip().split("\t")[-1]
@@ -0,0 +1,83 @@
+"""
+TMDB posters for the `-t` picker, fetched on demand into ~/.cache/btstrm/posters.
+
+fzf runs `python -m btstrm.posters URL` from its preview command, which
+prints the path of the cached poster and downloads it first if needed, so
+the picker opens without waiting for any image and a poster that was seen
+before costs no request. Files are named after a hash of their URL and the
+least recently shown ones are evicted once the directory grows past
+POSTER_CACHE_MAX_MB.
+"""
+
+import hashlib
+import os
+import shlex
+import sys
+import tempfile
+
+from btstrm import config
+from btstrm.cache import evict_lru
+
+poster_dir = os.path.join(config.cache_dir, "posters")
+SUFFIX = ".img"
+
+
+def poster_path(url):
+    return os.path.join(
+        poster_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + SUFFIX
+    )
+
+
+def fetch_poster(url):
+    """Path of the cached poster for url, downloading it if it is not cached."""
+    path = poster_path(url)
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    from btstrm import net
+
+    os.makedirs(poster_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=poster_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, net.get(url, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(64 * 1024):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    evict_lru(poster_dir, float(config.POSTER_CACHE_MAX_MB) * 1024 * 1024, SUFFIX)
+    return path
+
+
+def preview_command(field="{1}"):
+    """fzf --preview command showing the poster whose URL is in field."""
+    python = shlex.quote(sys.executable)
+    return (
+        f"poster=$({python} -m btstrm.posters {field}) && "
+        'chafa -s x20 --format=symbols "$poster"'
+    )
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python -m btstrm.posters URL", file=sys.stderr)
+        sys.exit(2)
+    try:
+        print(fetch_poster(sys.argv[1]))
+    except Exception as e:
+        print(f"Error loading image: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
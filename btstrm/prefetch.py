@@ -0,0 +1,143 @@
+"""
+Warming up a file through the btfs mount before the player opens it.
+
+btfs only downloads a piece when something reads it, so the player stalls
+on its first reads and seeks. A Prebuffer reads the start of the file and
+its tail, where MP4 moov atoms and MKV cues usually live, from a
+background thread so that those pieces are fetched ahead of the player.
+
+The same reader warms up the next episode of a season pack while the
+current one plays, after a delay and at a limited rate so that it does
+not compete with the file being watched.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+MB = 1024 * 1024
+CHUNK = MB
+
+
+def natural_key(path):
+    """Sort key that orders "E2" before "E10"."""
+    return [
+        (0, int(part), "") if part.isdigit() else (1, 0, part)
+        for part in re.split(r"(\d+)", path.lower())
+        if part
+    ]
+
+
+def next_media(media, current):
+    """The file after current in natural order, or None."""
+    ordered = sorted(media, key=natural_key)
+    if current not in ordered:
+        return None
+    index = ordered.index(current) + 1
+    return ordered[index] if index < len(ordered) else None
+
+
+def probe_bitrate(path):
+    """Bits per second of a media file according to ffprobe, or None."""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None
+    try:
+        output = subprocess.run(
+            [
+                ffprobe,
+                "-v",
+                "error",
+                "-show_entries",
+                "format=bit_rate",
+                "-of",
+                "csv=p=0",
+                path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        ).stdout.strip()
+        return int(output)
+    except (subprocess.SubprocessError, ValueError):
+        return None
+
+
+class Prebuffer:
+    def __init__(self, path, head_bytes, tail_bytes=0, rate=0, delay=0):
+        self.path = path
+        # Bytes per second, 0 for as fast as btfs delivers.
+        self.rate = rate
+        self.delay = delay
+        self.size = os.path.getsize(path)
+        self.head_bytes = min(head_bytes, self.size)
+        self.tail_bytes = min(tail_bytes, self.size - self.head_bytes)
+        self.head_read = 0
+        self.tail_read = 0
+        self.error = None
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def buffered(self):
+        return self.head_read + self.tail_read
+
+    @property
+    def target(self):
+        return self.head_bytes + self.tail_bytes
+
+    @property
+    def ranges(self):
+        """(start, end) byte ranges of the file that are read."""
+        return [(0, self.head_bytes), (self.size - self.tail_bytes, self.size)]
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="btstrm-prebuffer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _read(self, f, offset, length, counter):
+        f.seek(offset)
+        started = time.monotonic()
+        done = 0
+        while length > 0 and not self._stop.is_set():
+            data = f.read(min(CHUNK, length))
+            if not data:
+                break
+            length -= len(data)
+            setattr(self, counter, getattr(self, counter) + len(data))
+            if self.rate:
+                done += len(data)
+                ahead = done / self.rate - (time.monotonic() - started)
+                if ahead > 0 and self._stop.wait(ahead):
+                    break
+
+    def _run(self):
+        try:
+            if self.delay and self._stop.wait(self.delay):
+                return
+            with open(self.path, "rb", buffering=0) as f:
+                # The container header first, then the index at the end, then
+                # the rest of the beginning of the file.
+                first = min(CHUNK, self.head_bytes)
+                self._read(f, 0, first, "head_read")
+                self._read(f, self.size - self.tail_bytes, self.tail_bytes, "tail_read")
+                self._read(f, first, self.head_bytes - first, "head_read")
+        except OSError as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        """Block until everything is buffered or timeout seconds passed."""
+        self.done.wait(timeout)
+        return self.done.is_set() and self.error is None
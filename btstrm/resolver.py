@@ -0,0 +1,155 @@
+"""
+Turning the HTTP links of search results into something btfs can mount.
+
+A Jackett download link either redirects to a magnet link or serves a
+.torrent file. The redirect is read from the Location header without
+following it. A .torrent is streamed to ~/.cache/btstrm/torrents and
+stored under its infohash, so concurrent sessions never share a file and
+replaying a result needs no request at all: what each link resolved to
+is remembered for LINK_CACHE_TTL seconds.
+
+While the picker is open, the top RESOLVE_AHEAD results are resolved in
+the background so that the chosen one is usually ready right away.
+"""
+
+import os
+import tempfile
+import threading
+from urllib.parse import urljoin
+
+from btstrm import config, net
+from btstrm.bencode import BencodeError, info_hash
+from btstrm.cache import DiskCache, evict_lru
+
+torrent_dir = os.path.join(config.cache_dir, "torrents")
+link_cache = DiskCache(
+    os.path.join(config.cache_dir, "links"),
+    ttl=int(config.LINK_CACHE_TTL),
+    max_bytes=1024 * 1024,
+)
+MAX_REDIRECTS = 5
+MAX_TORRENT_BYTES = 16 * 1024 * 1024
+TORRENT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class ResolveError(Exception):
+    pass
+
+
+def is_http(uri):
+    return uri.startswith(("http://", "https://"))
+
+
+def torrent_path(infohash):
+    return os.path.join(torrent_dir, infohash + ".torrent")
+
+
+def cached(link):
+    """What link resolved to before, if that is still usable, else None."""
+    value = link_cache.get(link)
+    if value is None:
+        return None
+    if value.startswith("magnet:") or os.path.exists(value):
+        return value
+    return None
+
+
+def save_torrent(response):
+    """Stream a .torrent response body into the cache, returns its path."""
+    os.makedirs(torrent_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=torrent_dir, suffix=".tmp")
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > MAX_TORRENT_BYTES:
+                    raise ResolveError("response is too large for a .torrent file")
+                f.write(chunk)
+        with open(tmp_path, "rb") as f:
+            infohash = info_hash(f.read())
+        if not infohash:
+            raise ResolveError("response has no torrent info dictionary")
+        path = torrent_path(infohash)
+        os.replace(tmp_path, path)
+    except BencodeError as e:
+        os.remove(tmp_path)
+        raise ResolveError(f"response is not a .torrent file: {e}") from e
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    evict_lru(torrent_dir, TORRENT_CACHE_MAX_BYTES, ".torrent")
+    return path
+
+
+def fetch(link):
+    """Resolve link over HTTP to a magnet link or the path of a cached .torrent."""
+    url = link
+    for _ in range(MAX_REDIRECTS):
+        with net.get(
+            url, allow_redirects=False, stream=True, timeout=float(config.TIMEOUT)
+        ) as response:
+            location = response.headers.get("Location")
+            if response.is_redirect and location:
+                if location.startswith("magnet:"):
+                    return location
+                # Location may be relative to the URL that redirected.
+                url = urljoin(url, location)
+                continue
+            response.raise_for_status()
+            return save_torrent(response)
+    raise ResolveError(f"too many redirects for {link}")
+
+
+def resolve_now(link):
+    uri = cached(link)
+    if uri is None:
+        uri = fetch(link)
+        link_cache.set(link, uri)
+    return uri
+
+
+class Job:
+    def __init__(self, link):
+        self.link = link
+        self.uri = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.uri = resolve_now(self.link)
+        except (ResolveError, OSError) + net.NETWORK_ERRORS as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+def resolve_ahead(links):
+    """Start resolving links in the background, without waiting for them."""
+    for link in links:
+        if not is_http(link) or cached(link) is not None:
+            continue
+        with _jobs_lock:
+            if link in _jobs:
+                continue
+            job = _jobs[link] = Job(link)
+        threading.Thread(target=job.run, name="btstrm-resolve", daemon=True).start()
+
+
+def resolve(link):
+    """
+    Magnet link or path of a cached .torrent file for link, reusing a
+    background resolution if there is one. Raises ResolveError or one of
+    net.NETWORK_ERRORS.
+    """
+    with _jobs_lock:
+        job = _jobs.pop(link, None)
+    if job:
+        job.done.wait()
+        if job.error is None:
+            return job.uri
+    return resolve_now(link)
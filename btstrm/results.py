@@ -0,0 +1,167 @@
+"""
+Compact search results and their deduplication across indexers.
+
+Results are kept as __slots__ records holding numbers rather than
+preformatted strings. The same release returned by several indexers is
+merged into one record, keyed by infohash or, when an indexer does not
+report one, by its normalized title and size.
+"""
+
+import base64
+import os
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from btstrm.bencode import BencodeError, info_hash
+
+GB = 1024 * 1024 * 1024
+SORT_KEYS = ("seeds", "size", "score")
+
+btih_re = re.compile(r"urn:btih:([0-9a-zA-Z]+)")
+title_junk_re = re.compile(r"[\W_]+")
+
+
+def infohash_from_magnet(link):
+    """Hex infohash of a magnet link (hex or base32 btih), or None."""
+    if not link or not link.startswith("magnet:"):
+        return None
+    for xt in parse_qs(urlparse(link).query).get("xt", []):
+        match = btih_re.match(xt)
+        if not match:
+            continue
+        value = match.group(1)
+        if len(value) == 40:
+            return value.lower()
+        if len(value) == 32:
+            try:
+                return base64.b32decode(value.upper()).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def torrent_infohash(uri):
+    """Infohash of a magnet link or a local .torrent file, or None."""
+    if uri.endswith(".torrent") and os.path.isfile(uri):
+        try:
+            with open(uri, "rb") as f:
+                return info_hash(f.read())
+        except (OSError, BencodeError):
+            return None
+    return infohash_from_magnet(uri)
+
+
+def normalize_title(title):
+    return title_junk_re.sub(" ", title.lower()).strip()
+
+
+class Torrent:
+    __slots__ = (
+        "title",
+        "trackers",
+        "size",
+        "seeds",
+        "leechers",
+        "link",
+        "infohash",
+    )
+
+    def __init__(
+        self, title, tracker, size=0, seeds=0, leechers=0, link="", infohash=None
+    ):
+        self.title = title
+        self.trackers = [tracker] if isinstance(tracker, str) else list(tracker)
+        self.size = size
+        self.seeds = seeds
+        self.leechers = leechers
+        self.link = link
+        self.infohash = infohash.lower() if infohash else infohash_from_magnet(link)
+
+    @property
+    def display_title(self):
+        return f"{self.title} [{', '.join(self.trackers)}]"
+
+    @property
+    def size_human(self):
+        return "%.2f GB" % (self.size / GB)
+
+    @property
+    def score(self):
+        """Seeders per GB, so small well-seeded releases rank above huge ones."""
+        return self.seeds / max(self.size / GB, 0.1)
+
+    def merge(self, other):
+        for tracker in other.trackers:
+            if tracker not in self.trackers:
+                self.trackers.append(tracker)
+        # Indexers see the same swarm, so the best report wins. Its link is
+        # kept as it is the most likely to resolve.
+        if other.seeds > self.seeds:
+            self.seeds = other.seeds
+            self.link = other.link
+        self.leechers = max(self.leechers, other.leechers)
+        self.infohash = self.infohash or other.infohash
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["title"],
+            data["trackers"],
+            data["size"],
+            data["seeds"],
+            data["leechers"],
+            data["link"],
+            data["infohash"],
+        )
+
+
+class ResultStore:
+    """Thread-safe set of Torrents merged by infohash or normalized title and size."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.torrents = []
+        self.by_infohash = {}
+        self.by_title = {}
+
+    def __len__(self):
+        return len(self.torrents)
+
+    def add(self, torrent):
+        """Add or merge torrent. Returns True if it is a new release."""
+        title_key = (normalize_title(torrent.title), torrent.size)
+        with self.lock:
+            existing = None
+            if torrent.infohash:
+                existing = self.by_infohash.get(torrent.infohash)
+            if existing is None:
+                existing = self.by_title.get(title_key)
+                # Same name but a different known infohash is another release.
+                if existing and existing.infohash and torrent.infohash:
+                    existing = None
+
+            if existing is None:
+                self.torrents.append(torrent)
+                existing = torrent
+            else:
+                existing.merge(torrent)
+
+            if existing.infohash:
+                self.by_infohash.setdefault(existing.infohash, existing)
+            self.by_title.setdefault(title_key, existing)
+            return existing is torrent
+
+    def extend(self, torrents):
+        """Add torrents and return those that were not already known."""
+        return [torrent for torrent in torrents if self.add(torrent)]
+
+    def ranked(self, by="seeds"):
+        if by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {by}")
+        with self.lock:
+            torrents = list(self.torrents)
+        return sorted(torrents, key=lambda t: getattr(t, by), reverse=True)
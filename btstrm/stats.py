@@ -0,0 +1,106 @@
+"""
+Per-indexer search history: latency, failures and result counts.
+
+The last HISTORY searches of every indexer are kept in a JSON file. They
+are used to give each indexer its own deadline instead of the global
+TIMEOUT, to search the fastest indexers first and to skip indexers that
+keep failing for a while.
+"""
+
+import json
+import threading
+import time
+
+from btstrm.cache import write_json_atomic
+
+HISTORY = 50
+# Samples needed before the history is trusted to set a deadline.
+MIN_SAMPLES = 5
+MIN_TIMEOUT = 5.0
+# Deadline is this many times the 90th percentile of successful searches.
+TIMEOUT_FACTOR = 2.0
+# An indexer whose last DEAD_AFTER searches failed is skipped, but is tried
+# again once RETRY_DEAD_AFTER seconds have passed since its last failure.
+DEAD_AFTER = 5
+RETRY_DEAD_AFTER = 6 * 60 * 60
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class IndexerStats:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.samples = None
+
+    def _load(self):
+        if self.samples is None:
+            try:
+                with open(self.path, "r") as f:
+                    self.samples = json.load(f)
+            except (OSError, ValueError):
+                self.samples = {}
+        return self.samples
+
+    def record(self, indexer, latency, ok, count):
+        with self.lock:
+            history = self._load().setdefault(indexer, [])
+            history.append([time.time(), round(latency, 3), ok, count])
+            del history[:-HISTORY]
+
+    def save(self):
+        with self.lock:
+            if self.samples is not None:
+                write_json_atomic(self.path, self.samples)
+
+    def indexers(self):
+        with self.lock:
+            return sorted(self._load())
+
+    def history(self, indexer):
+        with self.lock:
+            return list(self._load().get(indexer, []))
+
+    def summary(self, indexer):
+        history = self.history(indexer)
+        latencies = [latency for _, latency, ok, _ in history if ok]
+        counts = [count for _, _, ok, count in history if ok]
+        failures = sum(1 for _, _, ok, _ in history if not ok)
+        return {
+            "searches": len(history),
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "error_rate": failures / len(history) if history else 0.0,
+            "results": sum(counts) / len(counts) if counts else 0.0,
+        }
+
+    def timeout_for(self, indexer, default):
+        """Deadline for one search of indexer, never above the global default."""
+        latencies = [latency for _, latency, ok, _ in self.history(indexer) if ok]
+        if len(latencies) < MIN_SAMPLES:
+            return default
+        adaptive = percentile(latencies, 0.9) * TIMEOUT_FACTOR
+        return min(default, max(MIN_TIMEOUT, adaptive))
+
+    def is_dead(self, indexer):
+        recent = self.history(indexer)[-DEAD_AFTER:]
+        if len(recent) < DEAD_AFTER or any(ok for _, _, ok, _ in recent):
+            return False
+        return time.time() - recent[-1][0] < RETRY_DEAD_AFTER
+
+    def order(self, indexers):
+        """Live indexers sorted by median latency (unknown ones first), and dead ones."""
+
+        def median(indexer):
+            p50 = self.summary(indexer)["p50"]
+            return -1 if p50 is None else p50
+
+        alive = [i for i in indexers if not self.is_dead(i)]
+        dead = [i for i in indexers if self.is_dead(i)]
+        return sorted(alive, key=median), dead
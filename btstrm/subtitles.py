@@ -0,0 +1,137 @@
+"""
+Subtitles for the files of a torrent, fetched with `osd` in the background.
+
+btfs only creates a file in its data directory once some of it has been
+downloaded, so a scheduler thread hands files to a small pool of workers
+as they appear instead of waiting on them one by one. The player starts
+right away: mpv finds subtitles that landed earlier through
+--sub-file-paths, and the ones for the file it is playing are added over
+its JSON IPC socket (--input-ipc-server) when they arrive.
+"""
+
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+
+SUBTITLE_EXTENSIONS = (".srt", ".ass", ".ssa", ".sub", ".vtt")
+SCAN_INTERVAL = 1.0
+
+
+def subtitle_files(file_path):
+    """Subtitles next to file_path whose name starts with its name."""
+    directory, name = os.path.split(file_path)
+    stem = os.path.splitext(name)[0]
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return set()
+    return {
+        os.path.join(directory, n)
+        for n in names
+        if n.startswith(stem) and n.lower().endswith(SUBTITLE_EXTENSIONS)
+    }
+
+
+def mpv_command(socket_path, *command, timeout=5.0):
+    """Send a command to mpv's IPC socket, waiting up to timeout for mpv to listen."""
+    payload = json.dumps({"command": list(command)}).encode("utf-8") + b"\n"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(socket_path)
+                sock.sendall(payload)
+            return True
+        except OSError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+
+class SubtitleFetcher:
+    def __init__(self, file_paths, title="", ipc_socket=None, workers=4):
+        self.pending = list(file_paths)
+        self.title = title
+        self.ipc_socket = ipc_socket
+        self.workers = workers
+        # Data directory path of the file the player is showing.
+        self.playing = None
+        self.fetched = {}
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    def start(self):
+        threading.Thread(
+            target=self._schedule, name="btstrm-subtitles", daemon=True
+        ).start()
+        for _ in range(self.workers):
+            threading.Thread(
+                target=self._work, name="btstrm-subtitles", daemon=True
+            ).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for process in self._processes:
+                process.terminate()
+
+    def _schedule(self):
+        while self.pending and not self._stop.is_set():
+            ready = [path for path in self.pending if os.path.exists(path)]
+            # The file being played is the one most worth fetching first.
+            ready.sort(key=lambda path: path != self.playing)
+            for path in ready:
+                self.pending.remove(path)
+                self._queue.put(path)
+            self._stop.wait(SCAN_INTERVAL)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                file_path = self._queue.get(timeout=SCAN_INTERVAL)
+            except queue.Empty:
+                continue
+            try:
+                self.fetch(file_path)
+            except OSError as e:
+                print(f"Error fetching subtitles for {file_path}: {e}")
+
+    def _osd(self, *args):
+        process = subprocess.Popen(
+            ["osd", *args],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        with self._lock:
+            self._processes.add(process)
+        try:
+            _, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        return stderr
+
+    def fetch(self, file_path):
+        before = subtitle_files(file_path)
+        stderr = self._osd(file_path)
+        # A title given with -s is searched when the file itself matched nothing.
+        if self.title and "No subtitles found." in stderr:
+            self._osd("-c", self.title, file_path)
+        if self._stop.is_set():
+            return
+
+        added = sorted(subtitle_files(file_path) - before)
+        self.fetched[file_path] = added
+        if added and self.ipc_socket and file_path == self.playing:
+            for subtitle in added:
+                mpv_command(self.ipc_socket, "sub-add", subtitle)
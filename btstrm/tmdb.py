@@ -0,0 +1,98 @@
+"""
+Alternative titles and posters from The Movie Database, used by `-t`.
+
+Only the poster <img> tags of the search page are of interest, so instead
+of building a tree of the whole document they are located with a regular
+expression and just those tags go through the stdlib HTML tokenizer.
+Parsed results are cached per query and language in ~/.cache/btstrm/tmdb.
+"""
+
+import os
+import re
+from html.parser import HTMLParser
+from urllib.parse import quote
+
+from btstrm import config, net
+from btstrm.cache import DiskCache
+
+# Attribute values may contain ">" as long as they are quoted.
+IMG_TAG = re.compile(r"""<img\b(?:[^>"']|"[^"]*"|'[^']*')*>""", re.IGNORECASE)
+POSTER_CLASS = "poster w-[100%]"
+
+title_cache = DiskCache(
+    os.path.join(config.cache_dir, "tmdb"),
+    ttl=int(config.TMDB_CACHE_TTL),
+    max_bytes=5 * 1024 * 1024,
+)
+
+
+class TagAttributes(HTMLParser):
+    """Attributes of the last start tag fed to the parser, entities decoded."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.attrs = {}
+
+    def handle_starttag(self, tag, attrs):
+        self.attrs = dict(attrs)
+
+    handle_startendtag = handle_starttag
+
+    def parse(self, tag):
+        self.reset()
+        self.attrs = {}
+        self.feed(tag)
+        return self.attrs
+
+
+def fetch_movie_data(search_term, language=None):
+    language = language or config.LANG
+    QUERY = quote(search_term)
+    url = f"{config.TMDB_URL}/search?query={QUERY}&language={language}"
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; rv:122.0) Gecko/20100101 Firefox/122.0",
+    }
+
+    response = net.get(url, headers=headers)
+    if response.status_code == 200:
+        return response.text
+    else:
+        print(f"Failed to fetch data from TMDB. Status code: {response.status_code}")
+        return ""
+
+
+def parse_html_for_posters_and_titles(html_content):
+    """(largest srcset URL, title) of every poster image, in page order."""
+    parser = TagAttributes()
+    results = []
+    for match in IMG_TAG.finditer(html_content):
+        tag = match.group(0)
+        if "poster" not in tag:
+            continue
+        attrs = parser.parse(tag)
+        if (
+            "loading" not in attrs
+            or attrs.get("class") != POSTER_CLASS
+            or attrs.get("alt") is None
+            or not attrs.get("srcset")
+        ):
+            continue
+        srcset = attrs["srcset"].split(",")[-1].strip().split(" ")[0]
+        results.append((srcset, attrs["alt"].strip()))
+    return results
+
+
+def search_alternative_titles(search_term, refresh=False):
+    key = [search_term.strip().lower(), config.LANG]
+    if not refresh:
+        cached = title_cache.get(key)
+        if cached is not None:
+            return [tuple(result) for result in cached]
+
+    html_content = fetch_movie_data(search_term)
+    results = parse_html_for_posters_and_titles(html_content)
+    # An empty page is usually a failed request, so it is not cached.
+    if html_content:
+        title_cache.set(key, results)
+    return results